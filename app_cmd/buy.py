@@ -80,5 +80,80 @@ def buy_cmd(args: Namespace):
         args.ntfy_url,
         args.ntfy_username,
         args.ntfy_password,
+        args.concurrency,
+        args.prearm_seconds,
+        args.burst_offsets,
+        args.http2,
+        args.solver_url,
+        args.proxy_file,
     )
     logger.info("抢票完成后退出程序。。。。。")
+
+
+def buy_headless_cmd(args: Namespace):
+    """
+    不启动 Gradio 的抢票进程，只导入抢票需要的模块，状态通过一个很小的 HTTP 接口查看
+    """
+    from util.LogConfig import loguru_config
+    import os
+    import time
+    import uuid
+
+    from util import LOG_DIR
+
+    log_file = loguru_config(
+        LOG_DIR, f"{uuid.uuid1()}.log", enable_console=True, file_colorize=False
+    )
+
+    from loguru import logger
+    from service.StatusService import (
+        BuyStatus,
+        start_status_report_thread,
+        start_status_server,
+    )
+    from task.buy import buy_stream
+
+    filename_only = os.path.basename(args.filename)
+    status = BuyStatus(filename=filename_only)
+    server = start_status_server(status, host=args.server_name, port=args.port or 0)
+    host, port = server.server_address[:2]
+    status_url = f"http://{host}:{port}"
+    status.startup_ms = (time.perf_counter() - args.started_at) * 1000
+    logger.info(f"{filename_only} 启动耗时 {status.startup_ms:.0f}ms")
+    if args.startup_budget_ms and status.startup_ms > args.startup_budget_ms:
+        logger.warning(
+            f"启动耗时 {status.startup_ms:.0f}ms 超过预算 {args.startup_budget_ms}ms"
+        )
+    print(f"抢票日志路径： {log_file}")
+    print(f"状态接口   ↓↓↓↓↓↓↓↓↓↓↓↓↓↓   {status_url}/status")
+
+    if args.endpoint_url:
+        start_status_report_thread(
+            status, self_url=f"{status_url}/status", to_url=args.endpoint_url
+        )
+
+    status.state = "running"
+    for msg in buy_stream(
+        args.tickets_info_str,
+        args.time_start,
+        args.interval,
+        args.mode,
+        args.total_attempts,
+        args.audio_path,
+        args.pushplusToken,
+        args.serverchanKey,
+        args.https_proxys,
+        args.ntfy_url,
+        args.ntfy_username,
+        args.ntfy_password,
+        args.concurrency,
+        args.prearm_seconds,
+        args.burst_offsets,
+        args.http2,
+        args.solver_url,
+        args.proxy_file,
+    ):
+        status.record(msg)
+        logger.info(msg)
+    status.state = "finished"
+    logger.info("抢票完成后退出程序。。。。。")
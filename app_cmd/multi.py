@@ -0,0 +1,92 @@
+from argparse import Namespace
+
+from util import GlobalStatusInstance
+
+
+def multi_cmd(args: Namespace):
+    from util.LogConfig import loguru_config
+    import uuid
+
+    from util import LOG_DIR
+
+    run_id = uuid.uuid1()
+    log_file = loguru_config(
+        LOG_DIR, f"{run_id}.log", enable_console=False, file_colorize=True
+    )
+
+    import json
+    import os
+    import gradio_client
+    from task.buy import buy_multi
+    from task.endpoint import start_heartbeat_thread
+    import gradio as gr
+    from loguru import logger
+    from gradio_log import Log
+
+    with open(args.plan, "r", encoding="utf-8") as f:
+        tasks = json.load(f)["tasks"]
+    # 配置里有 cookie，读取后删除临时文件
+    os.remove(args.plan)
+    names = [os.path.basename(task["filename"]) for task in tasks]
+
+    # 每个配置单独一个日志文件
+    task_log_files = {}
+    for name in names:
+        task_log_files[name] = os.path.join(LOG_DIR, f"{run_id}_{name}.log")
+        logger.add(
+            task_log_files[name],
+            level="DEBUG",
+            encoding="utf-8",
+            colorize=True,
+            filter=lambda record, name=name: record["extra"].get("task") == name,
+            format="<green>[{time:YYYY-MM-DD:HH:mm:ss.SSS}]</green>|<level>{level}</level>|<cyan>{name}</cyan>:<yellow>{line}</yellow>|<level>{message}</level>",
+        )
+
+    with gr.Blocks(
+        head="""<script src="https://cdn.jsdelivr.net/npm/@tailwindcss/browser@4"></script>""",
+        title=f"{len(names)} 个配置",
+        fill_height=True,
+    ) as demo:
+        gr.Markdown(
+            f"""
+            # 当前抢票 {", ".join(names)}
+            > 所有配置在同一个进程中运行，你可以在这里查看每个配置的运行日志
+            """
+        )
+        for name, task_log_file in task_log_files.items():
+            with gr.Tab(name):
+                Log(
+                    task_log_file,
+                    dark=True,
+                    scale=1,
+                    xterm_log_level="info",
+                    xterm_scrollback=5000,
+                    elem_classes="h-full",
+                )
+
+        def exit_program():
+            print("关闭程序...")
+            os._exit(0)
+
+        btn = gr.Button("关闭程序")
+        btn.click(fn=exit_program)
+
+    print(f"抢票日志路径： {log_file}")
+    print(f"运行程序网址   ↓↓↓↓↓↓↓↓↓↓↓↓↓↓   {', '.join(names)} ")
+    demo.launch(
+        server_name=args.server_name,
+        server_port=args.port,
+        share=args.share,
+        inbrowser=True,
+        prevent_thread_lock=True,
+    )
+    client = gradio_client.Client(args.endpoint_url)
+    assert demo.local_url
+    GlobalStatusInstance.nowTask = ",".join(names)
+    start_heartbeat_thread(
+        client,
+        self_url=demo.local_url,
+        to_url=args.endpoint_url,
+    )
+    buy_multi(tasks)
+    logger.info("抢票完成后退出程序。。。。。")
@@ -0,0 +1,55 @@
+from argparse import Namespace
+
+
+def proxies_cmd(args: Namespace):
+    from util.LogConfig import loguru_config
+    import functools
+    import os
+    import sys
+    import time
+
+    from util import LOG_DIR
+
+    log_file = loguru_config(
+        LOG_DIR, "proxies.log", enable_console=True, file_colorize=False
+    )
+
+    from loguru import logger
+    from util import ConfigDB
+    from util.ProxyProvider import KDL_API_URL, fetch_kuaidaili
+    from util.ProxyReplenisher import PROXY_FILE, ProxyReplenisher
+
+    # 环境变量优先，否则使用界面里保存的快代理配置
+    credentials = {
+        key: os.environ.get(f"BTB_KDL_{key.upper()}") or ConfigDB.get(f"kuaidaili_{key}")
+        for key in ("secret_id", "signature", "username", "password")
+    }
+    missing = [key for key, value in credentials.items() if not value]
+    if missing:
+        logger.error(f"缺少快代理配置: {', '.join(missing)}")
+        sys.exit(1)
+
+    output = args.output or PROXY_FILE
+    replenisher = ProxyReplenisher(
+        functools.partial(
+            fetch_kuaidaili,
+            credentials["signature"],
+            credentials["secret_id"],
+            credentials["username"],
+            credentials["password"],
+            api_url=args.api_url or KDL_API_URL,
+        ),
+        target=args.target,
+        output=output,
+        interval=args.interval,
+        max_age=args.max_age,
+        probe_timeout=args.timeout,
+        test_url=args.test_url,
+    ).start()
+    print(f"代理补充日志路径： {log_file}")
+    print(f"代理列表文件   ↓↓↓↓↓↓↓↓↓↓↓↓↓↓   {output}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        replenisher.stop()
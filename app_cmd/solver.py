@@ -0,0 +1,31 @@
+from argparse import Namespace
+
+
+def solver_cmd(args: Namespace):
+    from util.LogConfig import loguru_config
+    import time
+
+    from util import LOG_DIR
+
+    log_file = loguru_config(
+        LOG_DIR, "solver.log", enable_console=True, file_colorize=False
+    )
+
+    from loguru import logger
+    from geetest.TripleValidator import TripleValidator
+    from service.SolverService import (
+        DEFAULT_SOLVER_PORT,
+        SolverPool,
+        start_solver_server,
+    )
+
+    logger.info(f"加载 {args.workers} 份验证码模型...")
+    pool = SolverPool(TripleValidator, workers=args.workers, queue_size=args.queue_size)
+    server = start_solver_server(
+        pool, host=args.server_name, port=args.port or DEFAULT_SOLVER_PORT
+    )
+    host, port = server.server_address[:2]
+    print(f"过码服务日志路径： {log_file}")
+    print(f"过码服务   ↓↓↓↓↓↓↓↓↓↓↓↓↓↓   http://{host}:{port}")
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,218 @@
+"""
+离线验证码基准，在保存下来的图片上运行 Model.detect / Model.match
+
+    python -m bench.captcha_bench path/to/corpus --output result.json
+    python -m bench.captcha_bench path/to/corpus --compare baseline.json
+    python -m bench.captcha_bench path/to/corpus --variant default --variant int8 --threads 2
+
+数据集目录里是验证码图片和 labels.jsonl，每行 {"file": "xx.jpg", "clicks": [[x, y], ...]}，
+clicks 按文字从左到右的顺序给出正确的点击位置(像素)。没有标注的图片只统计耗时。
+设置环境变量 BTB_CAPTCHA_RECORD_DIR 后正常抢票或运行 geetest/TripleValidator.py，
+verify 通过的图片会自动保存成这种格式。
+
+--variant 可以重复，每个变体(default 表示 yolo.onnx / triple.onnx)依次测量后给出耗时和准确率的对比；
+会话参数没有指定时使用 BTB_ORT_* 环境变量，见 geetest/ModelConfig.py。
+"""
+
+import argparse
+import json
+import os
+import time
+
+STAGES = ["decode", "yolo", "nms", "crop", "siamese", "assignment"]
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_corpus(directory: str) -> list[tuple[str, list | None]]:
+    labels = {}
+    labels_path = os.path.join(directory, "labels.jsonl")
+    if os.path.exists(labels_path):
+        with open(labels_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    labels[item["file"]] = item["clicks"]
+    files = sorted(f for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTS))
+    return [(os.path.join(directory, f), labels.get(f)) for f in files]
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": 0, "p90": 0, "p99": 0, "mean": 0}
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(len(values) * q))], 3)
+
+    return {
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p99": pick(0.99),
+        "mean": round(sum(values) / len(values), 3),
+    }
+
+
+def inside(point, box) -> bool:
+    x, y = point
+    left, top, width, height = box
+    return left <= x <= left + width and top <= y <= top + height
+
+
+def run(model, corpus, warmup: int) -> dict:
+    for path, _ in corpus[:warmup]:
+        with open(path, "rb") as f:
+            img = f.read()
+        text_imgs, _, bg_imgs, bg_boxes = model.detect(img)
+        if text_imgs and bg_imgs:
+            model.match(text_imgs, bg_imgs, bg_boxes)
+
+    stage_ms: dict[str, list[float]] = {stage: [] for stage in STAGES}
+    total_ms = []
+    mismatched = labelled = correct_images = clicks = correct_clicks = 0
+    for path, label in corpus:
+        with open(path, "rb") as f:
+            img = f.read()
+        timings: dict[str, float] = {}
+        start = time.perf_counter()
+        text_imgs, text_boxes, bg_imgs, bg_boxes = model.detect(img, timings)
+        result_list = []
+        # 与 TripleValidator.solve 的判断一致，数量不对时不做匹配
+        if len(text_boxes) == len(bg_boxes) and len(text_boxes) > 1:
+            result_list, _ = model.match(text_imgs, bg_imgs, bg_boxes, timings)
+        else:
+            mismatched += 1
+        total_ms.append((time.perf_counter() - start) * 1000)
+        for stage, seconds in timings.items():
+            stage_ms[stage].append(seconds * 1000)
+
+        if label is None:
+            continue
+        labelled += 1
+        clicks += len(label)
+        boxes = [box for _, box in result_list]
+        hits = sum(1 for point, box in zip(label, boxes) if inside(point, box))
+        correct_clicks += hits
+        correct_images += hits == len(label) and len(boxes) == len(label)
+
+    return {
+        "images": len(corpus),
+        "labelled": labelled,
+        "total_ms": percentiles(total_ms),
+        "stages_ms": {stage: percentiles(v) for stage, v in stage_ms.items()},
+        "detect_mismatch_rate": round(mismatched / max(1, len(corpus)), 4),
+        "image_accuracy": round(correct_images / max(1, labelled), 4),
+        "click_accuracy": round(correct_clicks / max(1, clicks), 4),
+    }
+
+
+def print_report(result: dict, baseline: dict | None = None):
+    def delta(new, old):
+        if old in (None, 0):
+            return ""
+        return f"  ({(new - old) / old * 100:+.1f}%)"
+
+    print(f"{result['images']} 张图片，{result['labelled']} 张有标注")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    rows = [("total", result["total_ms"])] + list(result["stages_ms"].items())
+    for name, p in rows:
+        old = None
+        if baseline:
+            old = (
+                baseline["total_ms"]
+                if name == "total"
+                else baseline["stages_ms"].get(name, {})
+            ).get("p50")
+        print(
+            f"{name:<12}{p['p50']:>10.2f}{p['p90']:>10.2f}{p['p99']:>10.2f}"
+            f"{delta(p['p50'], old)}"
+        )
+    for key in ("detect_mismatch_rate", "image_accuracy", "click_accuracy"):
+        old = baseline.get(key) if baseline else None
+        suffix = f"  (基准 {old:.2%})" if old is not None else ""
+        print(f"{key:<22}{result[key]:>8.2%}{suffix}")
+
+
+def print_summary(results: dict):
+    print(f"{'variant':<12}{'total p50':>12}{'yolo p50':>12}{'siamese p50':>14}{'accuracy':>10}")
+    for label, r in results.items():
+        print(
+            f"{label:<12}{r['total_ms']['p50']:>12.2f}"
+            f"{r['stages_ms']['yolo']['p50']:>12.2f}"
+            f"{r['stages_ms']['siamese']['p50']:>14.2f}"
+            f"{r['image_accuracy']:>10.2%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("corpus", type=str, help="数据集目录")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用多少张图片")
+    parser.add_argument("--warmup", type=int, default=3, help="预热的图片数，不计入结果")
+    parser.add_argument(
+        "--variant",
+        action="append",
+        default=[],
+        help="模型变体，可以重复，default 为默认模型；不指定时使用 BTB_CAPTCHA_MODEL",
+    )
+    parser.add_argument("--threads", type=int, default=None, help="intra_op 线程数")
+    parser.add_argument(
+        "--inter_threads", type=int, default=None, help="inter_op 线程数"
+    )
+    parser.add_argument(
+        "--opt_level",
+        choices=["disable", "basic", "extended", "all"],
+        default=None,
+        help="图优化级别",
+    )
+    parser.add_argument(
+        "--execution_mode", choices=["sequential", "parallel"], default=None
+    )
+    parser.add_argument("--output", type=str, default="", help="结果写入 JSON 文件")
+    parser.add_argument("--compare", type=str, default="", help="与之前的 JSON 结果对比")
+    args = parser.parse_args()
+
+    from geetest.ModelConfig import ModelConfig
+    from geetest.TripleValidator import Model
+
+    corpus = load_corpus(args.corpus)
+    if args.limit:
+        corpus = corpus[: args.limit]
+    if not corpus:
+        parser.error(f"{args.corpus} 中没有图片")
+
+    overrides = {
+        key: value
+        for key, value in {
+            "intra_op_threads": args.threads,
+            "inter_op_threads": args.inter_threads,
+            "graph_optimization": args.opt_level,
+            "execution_mode": args.execution_mode,
+        }.items()
+        if value is not None
+    }
+    variants = args.variant or [None]
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    for variant in variants:
+        if variant is not None:
+            overrides["variant"] = "" if variant == "default" else variant
+        config = ModelConfig.from_env(**overrides)
+        label = config.variant or "default"
+        print(f"== {label}: {config}")
+        results[label] = run(Model(config=config), corpus, args.warmup)
+        print_report(results[label], baseline.get(label))
+    if len(results) > 1:
+        print_summary(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
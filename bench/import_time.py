@@ -0,0 +1,117 @@
+"""
+各入口模块的导入耗时，基于 python -X importtime，用来防止启动变慢
+
+    python -m bench.import_time --repeat 5 --top 10
+    python -m bench.import_time --budget task.buy=800 --budget util=150
+
+每个入口在独立的子进程中导入，取多次运行的中位数；设置 --budget 后超出预算时返回非零退出码
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = [
+    "util",
+    "task.buy",
+    "app_cmd.buy",
+    "service.WorkerService",
+    "tab.go",
+    "main",
+]
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> dict[str, int]:
+    """
+    返回 {模块名: 累计导入耗时(us)}
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        error = [
+            line for line in proc.stderr.splitlines() if not LINE_RE.match(line)
+        ]
+        raise RuntimeError(f"导入 {module} 失败:\n" + "\n".join(error[-5:]))
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if m:
+            cumulative[m.group(4)] = int(m.group(2))
+    return cumulative
+
+
+def run(module: str, repeat: int, top: int) -> dict:
+    samples = [measure(module) for _ in range(repeat)]
+    total_ms = statistics.median(s.get(module, 0) for s in samples) / 1000
+    names = set().union(*samples)
+    slowest = sorted(
+        (
+            (name, statistics.median(s.get(name, 0) for s in samples) / 1000)
+            for name in names
+            if name != module
+        ),
+        key=lambda x: x[1],
+        reverse=True,
+    )[:top]
+    return {"total_ms": total_ms, "slowest": slowest}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "modules", nargs="*", default=ENTRY_POINTS, help="要测量的入口模块"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5, help="列出最慢的前几个依赖")
+    parser.add_argument(
+        "--budget",
+        action="append",
+        default=[],
+        help="模块=毫秒，超出时退出码为 1，可以重复",
+    )
+    parser.add_argument("--output", type=str, default="", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+    budgets = {
+        k: float(v) for k, v in (item.split("=", 1) for item in args.budget)
+    }
+
+    results = {}
+    failed = []
+    for module in args.modules:
+        try:
+            results[module] = run(module, args.repeat, args.top)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            failed.append(module)
+            continue
+        r = results[module]
+        budget = budgets.get(module)
+        mark = ""
+        if budget is not None:
+            mark = f"  (预算 {budget:.0f}ms)"
+            if r["total_ms"] > budget:
+                mark += "  超出!"
+                failed.append(module)
+        print(f"{module:<24}{r['total_ms']:>10.1f} ms{mark}")
+        for name, ms in r["slowest"]:
+            print(f"    {name:<36}{ms:>10.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
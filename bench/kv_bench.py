@@ -0,0 +1,102 @@
+"""
+KVDatabase 存储后端的微基准，和原来的 TinyDB + JSONStorage 对比
+
+    python -m bench.kv_bench --reads 2000 --writes 200
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from tinydb import Query, TinyDB
+from tinydb.storages import JSONStorage
+
+from util.KVDatabase import KVDatabase
+
+COOKIES = [
+    {"name": f"cookie_{i}", "value": "x" * 64, "domain": ".bilibili.com"}
+    for i in range(30)
+]
+CONFIG_KEYS = [
+    "https_proxy",
+    "pushplusToken",
+    "serverchanKey",
+    "ntfyUrl",
+    "ntfyUsername",
+    "ntfyPassword",
+    "kuaidaili_secret_id",
+    "kuaidaili_signature",
+]
+
+
+class TinyDBBaseline:
+    """
+    原来 KVDatabase 的实现
+    """
+
+    def __init__(self, path):
+        self.db = TinyDB(path, storage=JSONStorage)
+        self.KeyValue = Query()
+
+    def insert(self, key, value):
+        if self.db.contains(self.KeyValue.key == key):
+            self.db.update({"value": value}, self.KeyValue.key == key)
+        else:
+            self.db.insert({"key": key, "value": value})
+
+    def get(self, key):
+        result = self.db.get(self.KeyValue.key == key)
+        return result["value"] if result else None
+
+
+def run(db, reads: int, writes: int) -> dict:
+    db.insert("cookie", COOKIES)
+    for key in CONFIG_KEYS:
+        db.insert(key, f"value of {key}")
+
+    start = time.perf_counter()
+    for i in range(reads):
+        db.get(CONFIG_KEYS[i % len(CONFIG_KEYS)])
+    read_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(writes):
+        db.insert(CONFIG_KEYS[i % len(CONFIG_KEYS)], f"value {i}")
+    write_elapsed = time.perf_counter() - start
+    return {
+        "read_us": read_elapsed / reads * 1e6,
+        "write_us": write_elapsed / writes * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--output", type=str, default="", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        candidates = {
+            "tinydb": lambda: TinyDBBaseline(os.path.join(tmp, "tinydb.json")),
+            "json": lambda: KVDatabase(os.path.join(tmp, "json.json"), backend="json"),
+            "sqlite": lambda: KVDatabase(
+                os.path.join(tmp, "sqlite.db"), backend="sqlite"
+            ),
+        }
+        for name, factory in candidates.items():
+            results[name] = run(factory(), args.reads, args.writes)
+
+    print(f"{'backend':<10}{'get (us/op)':>15}{'insert (us/op)':>18}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['read_us']:>15.1f}{r['write_us']:>18.1f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+生成 INT8 动态量化的验证码模型，保存为 geetest/model/<name>.int8.onnx
+
+    python -m bench.quantize_models
+    BTB_CAPTCHA_MODEL=int8 python main.py ...
+
+需要额外安装 onnx (pip install onnx)，量化后用 bench.captcha_bench --variant int8 对比精度和耗时
+"""
+
+import argparse
+import os
+
+from geetest.ModelConfig import MODEL_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--models", nargs="*", default=["yolo", "triple"], help="要量化的模型"
+    )
+    parser.add_argument("--variant", type=str, default="int8", help="输出文件的变体名")
+    parser.add_argument(
+        "--per_channel", action="store_true", help="按通道量化，精度更高但更慢"
+    )
+    args = parser.parse_args()
+
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        parser.error(f"量化需要安装 onnx: {e}")
+
+    for name in args.models:
+        src = os.path.join(MODEL_DIR, f"{name}.onnx")
+        dst = os.path.join(MODEL_DIR, f"{name}.{args.variant}.onnx")
+        quantize_dynamic(
+            src, dst, per_channel=args.per_channel, weight_type=QuantType.QUInt8
+        )
+        print(
+            f"{src} ({os.path.getsize(src) / 1e6:.1f}MB) -> "
+            f"{dst} ({os.path.getsize(dst) / 1e6:.1f}MB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
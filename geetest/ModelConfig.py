@@ -0,0 +1,153 @@
+import hashlib
+import os
+import platform
+from dataclasses import dataclass
+
+import loguru
+import onnxruntime
+
+from util import EXE_PATH, FILES_ROOT_PATH
+
+MODEL_DIR = os.path.join(FILES_ROOT_PATH, "geetest", "model")
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def model_path(name: str, variant: str) -> str:
+    """
+    variant 为空时使用 yolo.onnx，否则使用 yolo.<variant>.onnx，例如 yolo.int8.onnx
+
+    变体文件不存在时退回默认模型，只量化了其中一个模型也可以使用
+    """
+    default = os.path.join(MODEL_DIR, f"{name}.onnx")
+    if not variant:
+        return default
+    path = os.path.join(MODEL_DIR, f"{name}.{variant}.onnx")
+    if not os.path.exists(path):
+        loguru.logger.warning(f"{path} 不存在，使用 {default}")
+        return default
+    return path
+
+
+@dataclass
+class ModelConfig:
+    """
+    验证码模型文件和 onnxruntime 会话参数，线程数为 0 时由 onnxruntime 决定
+    """
+
+    variant: str = ""
+    yolo_path: str = ""
+    siamese_path: str = ""
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    graph_optimization: str = "all"
+    execution_mode: str = "sequential"
+    # 保存优化后模型的目录，为空时不缓存
+    cache_dir: str = ""
+
+    def __post_init__(self):
+        if self.graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(f"未知的图优化级别: {self.graph_optimization}")
+        if self.execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"未知的执行模式: {self.execution_mode}")
+        self.yolo_path = self.yolo_path or model_path("yolo", self.variant)
+        self.siamese_path = self.siamese_path or model_path("triple", self.variant)
+
+    @classmethod
+    def from_env(cls, **overrides) -> "ModelConfig":
+        """
+        BTB_CAPTCHA_MODEL       模型变体，如 int8
+        BTB_YOLO_MODEL          单独指定 YOLO 模型路径
+        BTB_SIAMESE_MODEL       单独指定 Siamese 模型路径
+        BTB_ORT_THREADS         intra_op 线程数
+        BTB_ORT_INTER_THREADS   inter_op 线程数
+        BTB_ORT_OPT_LEVEL       disable / basic / extended / all
+        BTB_ORT_EXECUTION_MODE  sequential / parallel
+        BTB_ORT_CACHE_DIR       优化后模型的缓存目录，设为 off 关闭
+        """
+        cache_dir = os.environ.get(
+            "BTB_ORT_CACHE_DIR", os.path.join(EXE_PATH, "onnx_cache")
+        )
+        config = {
+            "variant": os.environ.get("BTB_CAPTCHA_MODEL", ""),
+            "yolo_path": os.environ.get("BTB_YOLO_MODEL", ""),
+            "siamese_path": os.environ.get("BTB_SIAMESE_MODEL", ""),
+            "intra_op_threads": int(os.environ.get("BTB_ORT_THREADS", 0)),
+            "inter_op_threads": int(os.environ.get("BTB_ORT_INTER_THREADS", 0)),
+            "graph_optimization": os.environ.get("BTB_ORT_OPT_LEVEL", "all"),
+            "execution_mode": os.environ.get("BTB_ORT_EXECUTION_MODE", "sequential"),
+            "cache_dir": "" if cache_dir == "off" else cache_dir,
+        }
+        config.update(overrides)
+        return cls(**config)
+
+    def session_options(self) -> onnxruntime.SessionOptions:
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+            self.graph_optimization
+        ]
+        options.execution_mode = EXECUTION_MODES[self.execution_mode]
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        return options
+
+    def optimized_path(self, path: str) -> str:
+        """
+        优化后的图和 onnxruntime 版本、优化级别、CPU 有关，任何一项变化都使用新的文件
+        """
+        st = os.stat(path)
+        key = "|".join(
+            [
+                os.path.abspath(path),
+                str(st.st_size),
+                str(st.st_mtime_ns),
+                onnxruntime.__version__,
+                self.graph_optimization,
+                platform.machine(),
+                platform.processor(),
+            ]
+        )
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, f"{name}.{digest}.onnx")
+
+    def create_session(self, path: str) -> onnxruntime.InferenceSession:
+        if not self.cache_dir or self.graph_optimization == "disable":
+            return self._session(path, self.session_options())
+
+        cached = self.optimized_path(path)
+        if os.path.exists(cached):
+            options = self.session_options()
+            # 已经优化过，跳过加载时的图优化
+            options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS["disable"]
+            try:
+                return self._session(cached, options)
+            except Exception as e:
+                loguru.logger.warning(f"优化模型缓存 {cached} 不可用，重新生成: {e}")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 多个进程可能同时生成，先写临时文件再原子替换
+        tmp_path = f"{cached}.{os.getpid()}.tmp"
+        options = self.session_options()
+        options.optimized_model_filepath = tmp_path
+        session = self._session(path, options)
+        try:
+            os.replace(tmp_path, cached)
+        except OSError as e:
+            loguru.logger.warning(f"保存优化模型失败: {e}")
+        return session
+
+    @staticmethod
+    def _session(path: str, options) -> onnxruntime.InferenceSession:
+        return onnxruntime.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
@@ -0,0 +1,62 @@
+import importlib
+import threading
+import time
+
+import loguru
+import requests
+
+from geetest.Validator import Validator
+
+
+class RemoteValidator(Validator):
+    """
+    把过码请求发给本机的共享过码服务(main.py solver)，服务不可用时退回进程内的 TripleValidator
+
+    本地模型只在远程过码失败时才加载
+    """
+
+    # 服务连不上后多久再尝试
+    RETRY_AFTER = 30
+
+    def __init__(self, url: str, timeout: float = 60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.trust_env = False  # 本机服务不走系统代理
+        self._down_until = 0.0
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+
+    def need_api_key(self) -> bool:
+        return False
+
+    def have_gt_ui(self) -> bool:
+        return False
+
+    def fallback(self) -> Validator:
+        with self._fallback_lock:
+            if self._fallback is None:
+                module = importlib.import_module("geetest.TripleValidator")
+                self._fallback = module.get_validator()
+        return self._fallback
+
+    def validate(self, gt, challenge):
+        if time.time() >= self._down_until:
+            try:
+                resp = self.session.post(
+                    f"{self.url}/validate",
+                    json={"gt": gt, "challenge": challenge},
+                    timeout=self.timeout,
+                )
+                if resp.status_code != 503:
+                    resp.raise_for_status()
+                    data = resp.json()
+                    loguru.logger.info(
+                        f"过码服务 排队 {data['wait_ms']}ms 过码 {data['solve_ms']}ms"
+                    )
+                    return data["validate"]
+                loguru.logger.warning("过码服务繁忙，使用本地模型")
+            except requests.RequestException as e:
+                loguru.logger.warning(f"过码服务请求失败，使用本地模型: {e}")
+                self._down_until = time.time() + self.RETRY_AFTER
+        return self.fallback().validate(gt=gt, challenge=challenge)
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import loguru
+
+
+class SolveCache:
+    """
+    验证码图片 -> 点击坐标 的缓存，保存在 SQLite 里，多个抢票进程共用
+
+    只缓存 verify 通过的结果，命中后 verify 被拒绝时删除；超过 max_entries 时淘汰最久未使用的
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            path, timeout=10, check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS solves ("
+            "hash TEXT PRIMARY KEY, points TEXT NOT NULL, "
+            "scores TEXT NOT NULL, used_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS solves_used_at ON solves (used_at)")
+
+    @staticmethod
+    def key(img: bytes) -> str:
+        return hashlib.sha1(img).hexdigest()
+
+    def get(self, key: str) -> list[str] | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT points FROM solves WHERE hash = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE solves SET used_at = ? WHERE hash = ?", (time.time(), key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key: str, points: list[str], scores: list[float]):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO solves (hash, points, scores, used_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(points), json.dumps(scores), time.time()),
+            )
+            self.conn.execute(
+                "DELETE FROM solves WHERE hash IN ("
+                "SELECT hash FROM solves ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM solves WHERE hash = ?", (key,))
+
+
+def create_solve_cache(directory: str) -> SolveCache | None:
+    """
+    缓存条数由环境变量 BTB_CAPTCHA_CACHE_SIZE 控制，设为 0 关闭缓存
+    """
+    max_entries = int(os.environ.get("BTB_CAPTCHA_CACHE_SIZE", 5000))
+    if max_entries <= 0:
+        return None
+    try:
+        return SolveCache(os.path.join(directory, "captcha_cache.sqlite"), max_entries)
+    except sqlite3.Error as e:
+        loguru.logger.warning(f"验证码缓存不可用: {e}")
+        return None
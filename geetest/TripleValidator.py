@@ -1,17 +1,20 @@
 import json
 import os.path
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import loguru
 import numpy as np
-import onnxruntime
 import requests
 from PIL import Image
 from scipy.optimize import linear_sum_assignment
 from scipy.spatial.distance import cdist
 from scipy.special import softmax
+from geetest.ModelConfig import ModelConfig
+from geetest.SolveCache import SolveCache, create_solve_cache
 from geetest.Validator import Validator, test_validator
 from util import FILES_ROOT_PATH, bili_ticket_gt_python, EXE_PATH
 
@@ -25,65 +28,116 @@ def letterbox_resize(image, target_size=(384, 384), fill_color=(0, 0, 0)):
     :param image: 输入的PIL图像
     :param target_size: 目标尺寸 (width, height)
     :param fill_color: 填充颜色，默认为黑色 (0, 0, 0)
-    :return: 调整后的PIL图像
+    :return: 调整后的PIL图像和缩放比例，图像比目标尺寸大时(如小输入尺寸的模型)等比缩小
     """
     target_width, target_height = target_size
+    scale = min(1.0, target_width / image.width, target_height / image.height)
+    if scale < 1:
+        image = image.resize(
+            (round(image.width * scale), round(image.height * scale)),
+            Image.Resampling.BILINEAR,
+        )
     new_image = Image.new("RGB", (target_width, target_height), fill_color)
     paste_x = 0
     paste_y = 0
     new_image.paste(image, (paste_x, paste_y))
 
-    return new_image
+    return new_image, scale
+
+
+def postprocess(outputs: np.ndarray, confidence_thres: float, scale: float = 1.0):
+    """
+    YOLO 输出 (N, 4 + 类别数) 按置信度过滤，返回原图上的 [left, top, width, height] 和对应分数
+    """
+    max_scores = outputs[:, 4:].max(axis=1)
+    mask = max_scores >= confidence_thres
+    # 原来逐行计算时 float32 标量除以 int 会提升为 float64，这里保持一致
+    x, y, w, h = outputs[mask, :4].astype(np.float64).T / scale
+    # astype 向零取整，与 int() 一致
+    boxes = np.stack([x - w / 2, y - h / 2, w, h], axis=1).astype(np.int64)
+    return boxes.tolist(), max_scores[mask].tolist()
+
+
+def save_sample(directory: str, name: str, img: bytes, clicks: list):
+    """
+    图片保存为 <name>.jpg，点击位置追加到 labels.jsonl
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{name}.jpg"), "wb") as f:
+        f.write(img)
+    with open(os.path.join(directory, "labels.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"file": f"{name}.jpg", "clicks": clicks}) + "\n")
+
+
+def stage_timer(timings: dict | None):
+    """
+    返回 mark(stage)，把距上一次 mark 的耗时(秒)记到 timings[stage]；timings 为 None 时什么都不做
+    """
+    if timings is None:
+        return lambda stage: None
+    last = time.perf_counter()
+
+    def mark(stage: str):
+        nonlocal last
+        now = time.perf_counter()
+        timings[stage] = timings.get(stage, 0) + now - last
+        last = now
+
+    return mark
 
 
 class Model:
-    def __init__(self, debugDir=None):
-        self.yolo = onnxruntime.InferenceSession(
-            os.path.join(FILES_ROOT_PATH, "geetest", "model", "yolo.onnx")
-        )
-        self.siamese = onnxruntime.InferenceSession(
-            os.path.join(FILES_ROOT_PATH, "geetest", "model", "triple.onnx")
-        )
+    def __init__(self, debugDir=None, config: ModelConfig | None = None):
+        self.config = config or ModelConfig.from_env()
+        self.yolo = self.config.create_session(self.config.yolo_path)
+        self.siamese = self.config.create_session(self.config.siamese_path)
         if debugDir:
             os.makedirs(debugDir, exist_ok=True)
         self.debugDir = debugDir
         self.origin_img = None
         self.size = (96, 96)
 
-    def detect(self, img):
+    def warmup(self, rounds: int = 2):
+        """
+        用全零输入各推理几次，第一次推理的内存分配等开销不再落在开票时
+        """
+        model_input = self.yolo.get_inputs()[0]
+        shape = [
+            d if isinstance(d, int) else default
+            for d, default in zip(model_input.shape, (1, 3, 384, 384))
+        ]
+        yolo_input = np.zeros(shape, np.float32)
+        # 一次验证码通常是 3~4 个文字加同样数量的背景
+        siamese_input = np.zeros((8, 3, self.size[1], self.size[0]), np.float32)
+        for _ in range(rounds):
+            self.yolo.run(None, {model_input.name: yolo_input})
+            self.siamese.run(None, {"input": siamese_input})
+
+    def detect(self, img, timings: dict | None = None):
+        mark = stage_timer(timings)
         confidence_thres = 0.8
         iou_thres = 0.8
         model_inputs = self.yolo.get_inputs()
         input_shape = model_inputs[0].shape
-        input_width = input_shape[2]
-        input_height = input_shape[3]
+        # 动态尺寸的模型 shape 里是字符串，使用默认的 384
+        input_width = input_shape[2] if isinstance(input_shape[2], int) else 384
+        input_height = input_shape[3] if isinstance(input_shape[3], int) else 384
         self.origin_img = cv2.imdecode(
             np.frombuffer(img, np.uint8), cv2.IMREAD_ANYCOLOR
         )
         img = Image.fromarray(self.origin_img)
-        img = letterbox_resize(img, (input_height, input_width))
+        img, scale = letterbox_resize(img, (input_height, input_width))
         image_data = np.array(img) / 255.0
         image_data = np.transpose(image_data, (2, 0, 1))
         image_data = np.expand_dims(image_data, axis=0).astype(np.float32)
+        mark("decode")
         output = self.yolo.run(None, {model_inputs[0].name: image_data})
+        mark("yolo")
         outputs = np.transpose(np.squeeze(output[0]))
-        rows = outputs.shape[0]
-        boxes, scores, class_ids = [], [], []
-        for i in range(rows):
-            classes_scores = outputs[i][4:]
-            max_score = np.amax(classes_scores)
-            if max_score >= confidence_thres:
-                class_id = np.argmax(classes_scores)
-                x, y, w, h = outputs[i][0], outputs[i][1], outputs[i][2], outputs[i][3]
-                left = int((x - w / 2))
-                top = int((y - h / 2))
-                width = int(w)
-                height = int(h)
-                class_ids.append(class_id)
-                scores.append(max_score)
-                boxes.append([left, top, width, height])
+        boxes, scores = postprocess(outputs, confidence_thres, scale)
         indices = cv2.dnn.NMSBoxes(boxes, scores, confidence_thres, iou_thres)
         ret_boxes = sorted([boxes[i] for i in indices], key=lambda x: x[0])
+        mark("nms")
         text_imgs = []
         text_boxes = []
         bg_imgs = []
@@ -96,26 +150,29 @@ class Model:
             else:
                 bg_imgs.append(cropped.astype(np.float32))
                 bg_boxes.append(i)
+        mark("crop")
         return text_imgs, text_boxes, bg_imgs, bg_boxes
 
-    def match(self, text_imgs, bg_imgs, bg_imgs_box):
-        text_imgs = np.stack(
-            [
-                normalize_image(cv2.resize(img, self.size)).transpose(2, 0, 1)
-                for img in text_imgs
-            ]
-        )  # (n, C, H, W)
-        bg_imgs = np.stack(
-            [
-                normalize_image(cv2.resize(img, self.size)).transpose(2, 0, 1)
-                for img in bg_imgs
-            ]
-        )  # (n, C, H, W)
-
-        inputs = {"input": text_imgs}
-        text_embeddings = self.siamese.run(None, inputs)[0]
-        inputs = {"input": bg_imgs}
-        bg_embeddings = self.siamese.run(None, inputs)[0]
+    def match(self, text_imgs, bg_imgs, bg_imgs_box, timings: dict | None = None):
+        # 没有检测到文字或背景时立即失败，不要等到生成 w 之后才发现
+        if len(text_imgs) == 0 or len(bg_imgs) == 0:
+            raise ValueError(
+                f"detect error text_imgs: {len(text_imgs)} bg_imgs: {len(bg_imgs)}"
+            )
+        mark = stage_timer(timings)
+        # 文字和背景的小图放进同一个 batch，一次推理后再拆开
+        crops = list(text_imgs) + list(bg_imgs)
+        batch = np.empty((len(crops), 3, self.size[1], self.size[0]), np.float32)
+        for k, img in enumerate(crops):
+            batch[k] = cv2.resize(img, self.size).transpose(2, 0, 1)
+        batch /= 255.0
+        batch -= IMAGENET_MEAN.reshape(1, 3, 1, 1)
+        batch /= IMAGENET_STD.reshape(1, 3, 1, 1)
+
+        embeddings = self.siamese.run(None, {"input": batch})[0]
+        text_embeddings = embeddings[: len(text_imgs)]
+        bg_embeddings = embeddings[len(text_imgs) :]
+        mark("siamese")
         similarity_matrix = 1 - cdist(text_embeddings, bg_embeddings, metric="cosine")
         similarity_matrix = softmax(similarity_matrix, axis=1)
         mean_sim = similarity_matrix.mean(axis=1)
@@ -126,20 +183,46 @@ class Model:
             [(i, bg_imgs_box[j]) for i, j in zip(row_ind, col_ind)], key=lambda x: x[0]
         )
         match_scores = [similarity_matrix[i, j] for i, j in zip(row_ind, col_ind)]
+        mark("assignment")
         return result_list, match_scores
 
 
+REFRESH_URL = "http://api.geevisit.com/refresh.php"
+# (连接超时, 读取超时)，开票时宁可快速失败重试也不要卡住
+CAPTCHA_TIMEOUT = (3, 5)
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    验证码图片和 refresh 共用的连接池，重试时不再重新握手
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=4, pool_maxsize=8
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
 def download_img(url: str) -> bytes:
-    response = requests.get(url)
+    response = get_session().get(url, timeout=CAPTCHA_TIMEOUT)
     response.raise_for_status()
     return response.content
 
 
 def refresh(gt, challenge):
-    url = "http://api.geevisit.com/refresh.php"
     params = {"gt": gt, "challenge": challenge, "callback": "geetest_1717918222610"}
 
-    res = requests.get(url, params=params)
+    res = get_session().get(REFRESH_URL, params=params, timeout=CAPTCHA_TIMEOUT)
     res.raise_for_status()
     match = re.match(r"geetest_1717918222610\((.*)\)", res.text)
     if match is None:
@@ -153,15 +236,19 @@ def refresh(gt, challenge):
     return static_server_url
 
 
-def normalize_image(img_np, mean=None, std=None):
-    if std is None:
-        std = [0.229, 0.224, 0.225]
-    if mean is None:
-        mean = [0.485, 0.456, 0.406]
-    img_np = img_np.astype(np.float32) / 255.0
-    for i in range(3):
-        img_np[..., i] = (img_np[..., i] - mean[i]) / std[i]
-    return img_np
+def refresh_and_download(gt, challenge) -> bytes:
+    return download_img(refresh(gt, challenge))
+
+
+def warmup_connection(url: str = REFRESH_URL):
+    try:
+        get_session().head(url, timeout=CAPTCHA_TIMEOUT)
+    except requests.RequestException:
+        pass
+
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
 
 
 class TripleValidator(Validator):
@@ -172,37 +259,67 @@ class TripleValidator(Validator):
         return False
 
     def __init__(self, debugDir=None):
+        start = time.perf_counter()
         self.model = Model(debugDir=debugDir)
+        loaded = time.perf_counter()
+        self.model.warmup()
+        loguru.logger.info(
+            f"验证码模型加载 {(loaded - start) * 1000:.0f}ms，"
+            f"预热 {(time.perf_counter() - loaded) * 1000:.0f}ms"
+        )
         assert bili_ticket_gt_python
         self.click = bili_ticket_gt_python.ClickPy()
+        # Model 在识别过程中保存中间状态，多个抢票任务只在识别时串行，网络请求和等待各自进行
+        self.lock = threading.Lock()
+        # 下载下一张验证码图片，与本地识别重叠；同时过码的任务各自需要下载
+        self.io = ThreadPoolExecutor(max_workers=8, thread_name_prefix="captcha-io")
+        self.cache = create_solve_cache(EXE_PATH)
+        # 设置后把 verify 通过的图片和点击位置保存下来，作为 bench/captcha_bench.py 的数据集
+        self.record_dir = os.environ.get("BTB_CAPTCHA_RECORD_DIR", "")
+
+    def solve(self, pic_content: bytes):
+        """
+        识别图片，返回 (点击坐标, 匹配分数, 点击位置的像素坐标)
+        """
+        with self.lock:
+            text_imgs, text_boxes, bg_imgs, bg_boxes = self.model.detect(pic_content)
+            if (
+                len(text_boxes) != len(bg_boxes)
+                or len(text_boxes) == 1
+                or len(bg_boxes) == 1
+            ):
+                raise Exception(
+                    f"detect error fast retry text_boxes: {len(text_boxes)} bg_boxes: {len(bg_boxes)}"
+                )
+            result_list, output_res = self.model.match(text_imgs, bg_imgs, bg_boxes)
+        loguru.logger.debug(f"{output_res}")
+        clicks = [[i[0] + 30, i[1] + 30] for _, i in result_list]
+        point_list = [
+            f"{round(x / 333 * 10000)}_{round(y / 333 * 10000)}" for x, y in clicks
+        ]
+        return point_list, [float(x) for x in output_res], clicks
 
     def validate(self, gt, challenge):
         loguru.logger.info(f"TripleValidator gt: {gt} ; challenge: {challenge}")
+        # 和下面几次 ClickPy 请求并行，提前建立到 refresh 服务器的连接
+        self.io.submit(warmup_connection)
         (_, _) = self.click.get_c_s(gt, challenge)
         _type = self.click.get_type(gt, challenge)
         (c, s, args) = self.click.get_new_c_s_args(gt, challenge)
-        for _ in range(10):
+        next_img = self.io.submit(download_img, args)
+        for attempt in range(10):
             try:
                 before_calculate_key = time.time()
-                pic_content = download_img(args)
-                text_imgs, text_boxes, bg_imgs, bg_boxes = self.model.detect(
-                    pic_content
-                )
-                if (
-                    len(text_boxes) != len(bg_boxes)
-                    or len(text_boxes) == 1
-                    or len(bg_boxes) == 1
-                ):
-                    raise Exception(
-                        f"detect error fast retry text_boxes: {len(text_boxes)} bg_boxes: {len(bg_boxes)}"
-                    )
-                result_list, output_res = self.model.match(text_imgs, bg_imgs, bg_boxes)
-                loguru.logger.debug(f"{output_res}")
-                point_list = []
-                for idx, i in result_list:
-                    left = str(round((i[0] + 30) / 333 * 10000))
-                    top = str(round((i[1] + 30) / 333 * 10000))
-                    point_list.append(f"{left}_{top}")
+                pic_content = next_img.result()
+                cache_key = SolveCache.key(pic_content)
+                point_list = None
+                if self.cache is not None:
+                    point_list = self.cache.get(cache_key)
+                from_cache = point_list is not None
+                if from_cache:
+                    loguru.logger.info("验证码图片命中缓存")
+                else:
+                    point_list, scores, clicks = self.solve(pic_content)
                 w = self.click.generate_w(
                     ",".join(point_list),
                     gt,
@@ -217,12 +334,37 @@ class TripleValidator(Validator):
                     time.sleep(2 - w_use_time)
                 msg, validate = self.click.verify(gt, challenge, w)
                 if not validate:
+                    if self.cache is not None and from_cache:
+                        # 缓存的答案被拒绝，删除
+                        self.cache.delete(cache_key)
                     raise Exception("生成错误")
                 loguru.logger.info("本地验证码过码成功")
+                if self.cache is not None and not from_cache:
+                    self.cache.put(cache_key, point_list, scores)
+                if self.record_dir and not from_cache:
+                    save_sample(self.record_dir, cache_key, pic_content, clicks)
                 return validate
             except Exception as e:
+                # 先在后台换下一张图，日志和异常处理与下载同时进行
+                if attempt < 9:
+                    next_img = self.io.submit(refresh_and_download, gt, challenge)
                 loguru.logger.info(e)
-                args = refresh(gt, challenge)
+
+
+_instance: TripleValidator | None = None
+_instance_lock = threading.Lock()
+
+
+def get_validator() -> TripleValidator:
+    """
+    进程内共用一个 TripleValidator，模型只加载一次
+    """
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = TripleValidator()
+    return _instance
 
 
 if __name__ == "__main__":
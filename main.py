@@ -1,5 +1,9 @@
-import argparse
-import os
+import time
+
+START_TIME = time.perf_counter()  # 在其他导入之前记录，用于统计启动耗时
+
+import argparse  # noqa: E402
+import os  # noqa: E402
 
 
 def get_env_default(key: str, default, cast_func):
@@ -85,6 +89,129 @@ def main():
         default=os.environ.get("BTB_HTTPS_PROXYS", "none"),
         help="like none,http://127.0.0.1:8080",
     )
+    buy_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=get_env_default("CONCURRENCY", 1, int),
+        help="Number of createV2 requests in flight per config.",
+    )
+    buy_parser.add_argument(
+        "--prearm_seconds",
+        type=float,
+        default=get_env_default("PREARM_SECONDS", 0, float),
+        help="Seconds before time_start to run prepare and captcha (0 to disable).",
+    )
+    buy_parser.add_argument(
+        "--burst_offsets",
+        type=str,
+        default=os.environ.get("BTB_BURST_OFFSETS", ""),
+        help="Extra first-shot createV2 offsets around time_start in ms, like -20,0,20",
+    )
+    buy_parser.add_argument(
+        "--headless",
+        type=lambda x: x.lower() == "true",
+        default=get_env_default("HEADLESS", False, lambda x: str(x).lower() == "true"),
+        help="Run without the Gradio log page, report status over a small HTTP endpoint",
+    )
+    buy_parser.add_argument(
+        "--startup_budget_ms",
+        type=float,
+        default=get_env_default("STARTUP_BUDGET_MS", 0, float),
+        help="Warn when headless startup takes longer than this (0 to disable).",
+    )
+    buy_parser.add_argument(
+        "--http2",
+        type=lambda x: x.lower() == "true",
+        default=get_env_default("HTTP2", False, lambda x: str(x).lower() == "true"),
+        help="Multiplex requests over one HTTP/2 connection per proxy",
+    )
+    buy_parser.add_argument(
+        "--solver_url",
+        type=str,
+        default=os.environ.get("BTB_SOLVER_URL", ""),
+        help="Shared captcha solver started by `main.py solver`, like http://127.0.0.1:17861",
+    )
+    buy_parser.add_argument(
+        "--proxy_file",
+        type=str,
+        default=os.environ.get("BTB_PROXY_FILE", ""),
+        help="Follow the proxy list written by `main.py proxies` while running.",
+    )
+    # `multi` 子命令
+    multi_parser = subparsers.add_parser(
+        "multi", help="Run several ticket configs in one buying process"
+    )
+    multi_parser.add_argument(
+        "plan", type=str, help="JSON file with the BuyEngine arguments of each config."
+    )
+    multi_parser.add_argument(
+        "--endpoint_url",
+        type=str,
+        default=os.environ.get("BTB_ENDPOINT_URL", ""),
+        help="endpoint_url.",
+    )
+    # `solver` 子命令
+    solver_parser = subparsers.add_parser(
+        "solver", help="Load the captcha models once and serve all local buy processes"
+    )
+    solver_parser.add_argument(
+        "--workers",
+        type=int,
+        default=get_env_default("SOLVER_WORKERS", 2, int),
+        help="Captchas solved in parallel, each worker loads its own models.",
+    )
+    solver_parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=get_env_default("SOLVER_QUEUE_SIZE", 16, int),
+        help="Requests waiting beyond this are rejected and solved in the buy process.",
+    )
+    # `proxies` 子命令
+    proxies_parser = subparsers.add_parser(
+        "proxies", help="Keep a pool of verified kuaidaili proxies for running buy processes"
+    )
+    proxies_parser.add_argument(
+        "--target",
+        type=int,
+        default=get_env_default("PROXY_TARGET", 5, int),
+        help="Number of verified proxies to keep.",
+    )
+    proxies_parser.add_argument(
+        "--interval",
+        type=float,
+        default=get_env_default("PROXY_INTERVAL", 30, float),
+        help="Seconds between health checks.",
+    )
+    proxies_parser.add_argument(
+        "--max_age",
+        type=float,
+        default=get_env_default("PROXY_MAX_AGE", 0, float),
+        help="Replace proxies older than this many seconds when the provider gives no expiry (0 to disable).",
+    )
+    proxies_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=get_env_default("PROXY_TIMEOUT", 3, float),
+        help="Health check timeout in seconds.",
+    )
+    proxies_parser.add_argument(
+        "--output",
+        type=str,
+        default=os.environ.get("BTB_PROXY_FILE", ""),
+        help="Proxy list file, defaults to live_proxies.json next to config.json.",
+    )
+    proxies_parser.add_argument(
+        "--api_url",
+        type=str,
+        default=os.environ.get("BTB_KDL_API_URL", ""),
+        help="Kuaidaili DPS API, point it at a local stand-in for testing.",
+    )
+    proxies_parser.add_argument(
+        "--test_url",
+        type=str,
+        default=os.environ.get("BTB_PROXY_TEST_URL", "https://www.bilibili.com"),
+        help="URL requested through each proxy to check it.",
+    )
     # `--worker` 子命令
     worker_parser = subparsers.add_parser("worker", help="Start the ticket worker ui")  # noqa: F841
     worker_parser.add_argument(
@@ -123,10 +250,27 @@ def main():
     )
 
     args = parser.parse_args()
-    if args.command == "buy":
+    args.started_at = START_TIME
+    if args.command == "buy" and args.headless:
+        from app_cmd.buy import buy_headless_cmd
+
+        buy_headless_cmd(args=args)
+    elif args.command == "buy":
         from app_cmd.buy import buy_cmd
 
         buy_cmd(args=args)
+    elif args.command == "multi":
+        from app_cmd.multi import multi_cmd
+
+        multi_cmd(args=args)
+    elif args.command == "solver":
+        from app_cmd.solver import solver_cmd
+
+        solver_cmd(args=args)
+    elif args.command == "proxies":
+        from app_cmd.proxies import proxies_cmd
+
+        proxies_cmd(args=args)
     elif args.command == "worker":
         from app_cmd.worker import worker_cmd
 
@@ -21,7 +21,8 @@ a = Analysis(
         'gradio_calendar': 'py',  # Collect'
         'gradio_log': 'py',  # Collect'
     },
-    hiddenimports=['geetest.TripleValidator', 'geetest.AmorterValidator', 'bili_ticket_gt_python',
+    hiddenimports=['geetest.TripleValidator', 'geetest.RemoteValidator', 'geetest.AmorterValidator',
+                   'bili_ticket_gt_python',
                    'scipy._lib.array_api_compat.numpy.fft'],
     hookspath=[],
     hooksconfig={},
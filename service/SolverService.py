@@ -0,0 +1,170 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from loguru import logger
+
+DEFAULT_SOLVER_PORT = 17861
+
+
+class SolverBusy(Exception):
+    pass
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class SolveStats:
+    """
+    最近若干次请求的排队时间和过码时间
+    """
+
+    def __init__(self, window: int = 1000):
+        self.lock = threading.Lock()
+        self.total = 0
+        self.success = 0
+        self.rejected = 0
+        self.wait_ms: deque = deque(maxlen=window)
+        self.solve_ms: deque = deque(maxlen=window)
+
+    def record(self, wait_ms: float, solve_ms: float, ok: bool):
+        with self.lock:
+            self.total += 1
+            self.success += ok
+            self.wait_ms.append(wait_ms)
+            self.solve_ms.append(solve_ms)
+
+    def reject(self):
+        with self.lock:
+            self.rejected += 1
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            wait_ms, solve_ms = list(self.wait_ms), list(self.solve_ms)
+            result = {
+                "total": self.total,
+                "success": self.success,
+                "rejected": self.rejected,
+            }
+        for name, values in (("wait_ms", wait_ms), ("solve_ms", solve_ms)):
+            result[name] = {
+                "p50": round(percentile(values, 0.5), 1),
+                "p95": round(percentile(values, 0.95), 1),
+                "max": round(max(values, default=0), 1),
+            }
+        return result
+
+
+class SolverPool:
+    """
+    固定数量的验证器，每个验证器同一时间只处理一个请求
+
+    排队的请求超过 queue_size 时直接拒绝，调用方应退回本地过码
+    """
+
+    def __init__(self, factory: Callable, workers: int = 2, queue_size: int = 16):
+        self.workers = max(1, workers)
+        self.validators: queue.Queue = queue.Queue()
+        for _ in range(self.workers):
+            self.validators.put(factory())
+        self.slots = threading.BoundedSemaphore(self.workers + max(0, queue_size))
+        self.stats = SolveStats()
+
+    def pending(self) -> int:
+        return self.workers - self.validators.qsize()
+
+    def validate(self, gt: str, challenge: str) -> tuple[str, float, float]:
+        if not self.slots.acquire(blocking=False):
+            self.stats.reject()
+            raise SolverBusy()
+        try:
+            start = time.perf_counter()
+            validator = self.validators.get()
+            got = time.perf_counter()
+            try:
+                result = validator.validate(gt=gt, challenge=challenge)
+            finally:
+                self.validators.put(validator)
+            wait_ms = (got - start) * 1000
+            solve_ms = (time.perf_counter() - got) * 1000
+            self.stats.record(wait_ms, solve_ms, bool(result))
+            return result, wait_ms, solve_ms
+        finally:
+            self.slots.release()
+
+
+def start_solver_server(
+    pool: SolverPool, host: str = "127.0.0.1", port: int = DEFAULT_SOLVER_PORT
+) -> ThreadingHTTPServer:
+    """
+    本机过码服务
+
+    POST /validate  {"gt": ..., "challenge": ...} -> {"validate": ..., "wait_ms", "solve_ms"}
+    GET  /health    存活检查
+    GET  /stats     请求数和延迟分位数
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body: dict):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"status": "ok", "workers": pool.workers})
+            elif self.path == "/stats":
+                self._reply(200, {**pool.stats.to_dict(), "busy": pool.pending()})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/validate":
+                self._reply(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length))
+                gt, challenge = payload["gt"], payload["challenge"]
+            except (ValueError, KeyError, TypeError):
+                self._reply(400, {"error": "bad request"})
+                return
+            try:
+                validate, wait_ms, solve_ms = pool.validate(gt, challenge)
+            except SolverBusy:
+                self._reply(503, {"error": "busy"})
+                return
+            except Exception as e:
+                logger.exception(e)
+                self._reply(500, {"error": str(e)})
+                return
+            logger.info(
+                f"过码 {'成功' if validate else '失败'} 排队 {wait_ms:.0f}ms 过码 {solve_ms:.0f}ms"
+            )
+            self._reply(
+                200,
+                {
+                    "validate": validate,
+                    "wait_ms": round(wait_ms, 1),
+                    "solve_ms": round(solve_ms, 1),
+                },
+            )
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
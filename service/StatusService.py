@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from loguru import logger
+
+
+@dataclass
+class BuyStatus:
+    filename: str
+    state: str = "starting"
+    startup_ms: float = 0
+    started_at: float = field(default_factory=time.time)
+    message_count: int = 0
+    messages: deque = field(default_factory=lambda: deque(maxlen=500))
+
+    def record(self, msg: str):
+        self.message_count += 1
+        self.messages.append(f"{time.strftime('%H:%M:%S')} {msg}")
+
+    def to_dict(self, lines: int = 1) -> dict:
+        return {
+            "filename": self.filename,
+            "pid": os.getpid(),
+            "state": self.state,
+            "startup_ms": round(self.startup_ms, 1),
+            "uptime": round(time.time() - self.started_at, 1),
+            "message_count": self.message_count,
+            "messages": list(self.messages)[-lines:] if lines > 0 else [],
+        }
+
+
+def start_status_server(
+    status: BuyStatus, host: str = "127.0.0.1", port: int = 0
+) -> ThreadingHTTPServer:
+    """
+    无界面抢票进程的状态接口
+
+    GET  /status?lines=N  返回状态和最近 N 条日志
+    POST /exit            退出进程
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body: dict):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path not in ("/", "/status"):
+                self._reply(404, {"error": "not found"})
+                return
+            lines = int(parse_qs(url.query).get("lines", ["20"])[0])
+            self._reply(200, status.to_dict(lines))
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/exit":
+                self._reply(404, {"error": "not found"})
+                return
+            self._reply(200, {"status": "exiting"})
+            threading.Timer(0.1, os._exit, args=(0,)).start()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_status_report_thread(
+    status: BuyStatus, self_url: str, to_url: str, interval: float = 2
+):
+    """
+    定时向主界面报告状态，主界面只展示，不会把它当作 worker 分配任务
+
+    直接用 requests 调用 report_buy 接口，不导入 gradio_client
+    """
+    report_url = f"{to_url.rstrip('/')}/run/report_buy"
+    cnt = 0
+
+    def report_loop():
+        nonlocal cnt
+        while True:
+            try:
+                requests.post(
+                    report_url,
+                    json={"data": [self_url, f"{status.filename} {status.state}"]},
+                    timeout=interval,
+                ).raise_for_status()
+                cnt = 0
+            except requests.RequestException as e:
+                cnt += 1
+                logger.error(f"report_status error: {e}")
+                if cnt > 100:
+                    logger.error("report_status error too many times, exit")
+                    time.sleep(3)
+                    os._exit(1)
+            time.sleep(interval)
+
+    threading.Thread(target=report_loop, daemon=True).start()
@@ -21,6 +21,10 @@ class BuyRequest(BaseModel):
     ntfy_username: str | None
     ntfy_password: str | None
     serverchanKey: str | None
+    concurrency: int = 1
+    prearm_seconds: float = 0
+    burst_offsets: str = ""
+    http2: bool = False
 
 
 current_task_thread: threading.Thread | None = None
@@ -59,6 +63,11 @@ def create_worker_app(app: FastAPI, args):
                     ntfy_username=data.ntfy_username,
                     ntfy_password=data.ntfy_password,
                     https_proxys=args.https_proxys,
+                    concurrency=data.concurrency,
+                    prearm_seconds=data.prearm_seconds,
+                    burst_offsets=data.burst_offsets,
+                    http2=data.http2,
+                    cancel_event=cancel_event,
                 ):
                     if cancel_event.is_set():
                         logger.info("任务被取消")
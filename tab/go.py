@@ -2,26 +2,34 @@ import datetime
 import importlib
 import os
 import time
+from typing import Callable
+
 import gradio as gr
 from gradio import SelectData
 from loguru import logger
 import requests
 
 from geetest.Validator import Validator
-from task.buy import buy_new_terminal
+from task.buy import (
+    buy_multi_terminal,
+    buy_new_terminal,
+    start_proxy_daemon_terminal,
+    start_solver_terminal,
+)
 from util import ConfigDB, Endpoint, GlobalStatusInstance, time_service
 from util import bili_ticket_gt_python
-from util.ProxyProvider import get_proxies_from_kuaidaili, filter_and_rank_proxies, ping_proxy
+from util.ProxyProvider import get_probe_cache, iter_proxies_from_kuaidaili, probe_proxies
 
 def withTimeString(string):
     return f"{datetime.datetime.now()}: {string}"
 
 
 ways: list[str] = []
-ways_detail: list[Validator] = []
+# 取验证器的函数，用到时才加载模型
+ways_detail: list[Callable[[], Validator]] = []
 if bili_ticket_gt_python is not None:
     ways_detail.insert(
-        0, importlib.import_module("geetest.TripleValidator").TripleValidator()
+        0, lambda: importlib.import_module("geetest.TripleValidator").get_validator()
     )
     ways.insert(0, "本地过验证码v2(Amorter提供)")
     # ways_detail.insert(0, importlib.import_module("geetest.AmorterValidator").AmorterValidator())
@@ -101,6 +109,13 @@ def go_tab(demo: gr.Blocks):
                 outputs=None,
             )
 
+            def load_timeoffset():
+                # 第一次校时在后台进行，页面打开时等它完成再显示，避免显示 0
+                time_service.wait_synced(10)
+                return float(format(time_service.get_timeoffset() * 1000, ".2f"))
+
+            demo.load(fn=load_timeoffset, inputs=None, outputs=time_diff_ui)
+
         # 验证码选择
         select_way = 0
         way_select_ui = gr.Radio(
@@ -144,29 +159,29 @@ def go_tab(demo: gr.Blocks):
 
             https_proxy_submit_btn = gr.Button("保存并检测这些代理", visible=True)
 
+            def proxy_status(rtt):
+                return "❌ 不可达" if rtt == float("inf") else f"✅ {rtt:.2f}s"
+
             def save_manual_proxy(proxy_str):
-                proxies = [p.strip() for p in proxy_str.split(",") if p.strip()]
+                proxies = list(dict.fromkeys(p.strip() for p in proxy_str.split(",") if p.strip()))
                 if not proxies:
-                    return [["❌ 无代理", ""]]
+                    yield [["❌ 无代理", ""]]
+                    return
 
                 ConfigDB.insert("https_proxy", proxy_str)
-                results = []
-                for proxy in proxies:
-                    try:
-                        rtt = ping_proxy(proxy)
-                        if rtt == float("inf"):
-                            results.append([proxy, "❌ 不可达"])
-                        else:
-                            results.append([proxy, f"✅ {rtt:.2f}s"])
-                    except Exception:
-                        results.append([proxy, "❌ 测试异常"])
-                return results
-
+                # 先列出全部代理，每测完一个就刷新一次表格
+                results = [[proxy, "⏳ 检测中"] for proxy in proxies]
+                row_of = {proxy: i for i, proxy in enumerate(proxies)}
+                yield results
+                for proxy, rtt in probe_proxies(proxies, cache=get_probe_cache()):
+                    results[row_of[proxy]][1] = proxy_status(rtt)
+                    yield results
+
+            # 生成器需要走队列才能流式刷新
             https_proxy_submit_btn.click(
                 fn=save_manual_proxy,
                 inputs=https_proxy_ui,
                 outputs=proxy_status_table,
-                queue=False,
             )
 
             # ==== 快代理 ====
@@ -235,46 +250,51 @@ def go_tab(demo: gr.Blocks):
             def refresh_proxies_with_status():
                 signature = ConfigDB.get("kuaidaili_signature")
                 if not signature:
-                    return [["❌ 请填写 signature", ""]]
+                    yield [["❌ 请填写 signature", ""]]
+                    return
                 secret_id = ConfigDB.get("kuaidaili_secret_id")
                 if not secret_id:
-                    return [["❌ 请填写 secret_id", ""]]
+                    yield [["❌ 请填写 secret_id", ""]]
+                    return
                 username = ConfigDB.get("kuaidaili_username")
                 if not username:
-                    return [["❌ 请填写用户名", ""]]
+                    yield [["❌ 请填写用户名", ""]]
+                    return
                 password = ConfigDB.get("kuaidaili_password")
                 if not password:
-                    return [["❌ 请填写密码", ""]]
+                    yield [["❌ 请填写密码", ""]]
+                    return
                 num = ConfigDB.get("kuaidaili_num") or 5
                 if not isinstance(num, int) or num <= 0:
-                    return [["❌ 请填写有效的拉取数量", ""]]
+                    yield [["❌ 请填写有效的拉取数量", ""]]
+                    return
                 max_timeout = ConfigDB.get("kuaidaili_max_timeout") or 5
                 if not isinstance(max_timeout, (int, float)) or max_timeout <= 0:
-                    return [["❌ 请填写有效的最大超时", ""]]
-                raw_list = get_proxies_from_kuaidaili(signature, secret_id, username, password, num, max_timeout=max_timeout)
-                if not raw_list:
-                    return [["❌ 拉取失败", ""]]
+                    yield [["❌ 请填写有效的最大超时", ""]]
+                    return
 
+                # 拉取时已经检测过，直接展示检测结果，不再重复测速
                 results = []
                 valid = []
-                logger.info(f"获取到 {len(raw_list)} 个代理")
-                logger.info(f"代理列表: {raw_list}")
-                for proxy in raw_list:
-                    rtt = ping_proxy(proxy)
-                    if rtt == float("inf"):
-                        results.append([proxy, "❌ 不可达"])
-                    else:
-                        results.append([proxy, f"✅ {rtt:.2f}s"])
+                for proxy, rtt in iter_proxies_from_kuaidaili(
+                    signature, secret_id, username, password, num, max_timeout=max_timeout
+                ):
+                    results.append([proxy, proxy_status(rtt)])
+                    if rtt != float("inf"):
                         valid.append(proxy)
+                    yield results
+                if not valid:
+                    yield results + [["❌ 拉取失败", ""]]
+                    return
 
+                logger.info(f"获取到 {len(valid)} 个代理")
+                logger.info(f"代理列表: {valid}")
                 ConfigDB.insert("https_proxy", ",".join(valid))
-                return results
 
             refresh_proxy_btn.click(
                 fn=refresh_proxies_with_status,
                 inputs=[],
                 outputs=proxy_status_table,
-                queue=False,
             )
 
             # ==== 模式切换逻辑 ====
@@ -430,6 +450,52 @@ def go_tab(demo: gr.Blocks):
                 minimum=1,
                 info="设置抢票任务之间的时间间隔（单位：毫秒），建议不要设置太小",
             )
+            concurrency_ui = gr.Number(
+                label="并发请求数",
+                value=1,
+                minimum=1,
+                maximum=16,
+                step=1,
+                precision=0,
+                info="同一个配置同时在途的下单请求数量，越大越容易触发风控",
+            )
+            prearm_seconds_ui = gr.Number(
+                label="提前准备时间",
+                value=0,
+                minimum=0,
+                maximum=600,
+                info="在开票前多少秒完成订单准备和验证码（单位：秒），0 表示开票后再准备",
+            )
+            burst_offsets_ui = gr.Textbox(
+                label="开票突发请求",
+                value="",
+                info="开票瞬间额外发送的下单请求相对开票时间的偏移（单位：毫秒），如 -20,0,20，配合提前准备使用",
+            )
+            http2_ui = gr.Checkbox(
+                label="使用 HTTP/2",
+                value=False,
+                info="同一代理下的并发请求复用一条连接",
+            )
+            single_process_ui = gr.Checkbox(
+                label="单进程运行所有配置",
+                value=False,
+                info="所有配置在一个进程里运行，共用验证码模型和连接池，节省内存和启动时间",
+            )
+            shared_solver_ui = gr.Checkbox(
+                label="共享过码服务",
+                value=False,
+                info="本机启动一个过码进程，所有抢票进程共用一份验证码模型，过码服务不可用时自动在抢票进程内过码",
+            )
+            auto_proxy_ui = gr.Checkbox(
+                label="后台补充快代理",
+                value=False,
+                info="启动一个进程持续检测并补充快代理的代理，抢票进程运行中自动换用最新的代理列表",
+            )
+            headless_ui = gr.Checkbox(
+                label="无界面运行",
+                value=False,
+                info="抢票进程不启动日志网页，启动更快，日志在终端和日志文件中查看",
+            )
             mode_ui = gr.Radio(
                 label="抢票次数",
                 choices=["无限", "有限"],
@@ -468,7 +534,21 @@ def go_tab(demo: gr.Blocks):
         return assigned_proxies
 
     def start_go(
-        files, time_start, interval, mode, total_attempts, audio_path, https_proxys
+        files,
+        time_start,
+        interval,
+        mode,
+        total_attempts,
+        audio_path,
+        https_proxys,
+        concurrency,
+        prearm_seconds,
+        burst_offsets,
+        http2,
+        single_process,
+        headless,
+        shared_solver,
+        auto_proxy,
     ):
         if not files:
             return [gr.update(value=withTimeString("未提交抢票配置"), visible=True)]
@@ -480,6 +560,16 @@ def go_tab(demo: gr.Blocks):
         https_proxy_list = ["none"] + https_proxys.split(",")
         assigned_proxies: list[list[str]] = []
         assigned_proxies_next_idx = 0
+        local_tasks: list[dict] = []
+        # 单进程时模型本来就只加载一次，不需要过码服务
+        solver_url = (
+            start_solver_terminal() if shared_solver and not single_process else ""
+        )
+        proxy_file = (
+            start_proxy_daemon_terminal(int(ConfigDB.get("kuaidaili_num") or 5))
+            if auto_proxy
+            else ""
+        )
         for idx, filename in enumerate(files):
             with open(filename, "r", encoding="utf-8") as file:
                 content = file.read()
@@ -502,6 +592,10 @@ def go_tab(demo: gr.Blocks):
                         "ntfy_url": ConfigDB.get("ntfyUrl"),
                         "ntfy_username": ConfigDB.get("ntfyUsername"),
                         "ntfy_password": ConfigDB.get("ntfyPassword"),
+                        "concurrency": concurrency,
+                        "prearm_seconds": prearm_seconds,
+                        "burst_offsets": burst_offsets,
+                        "http2": http2,
                     },
                 )
                 endpoints_next_idx += 1
@@ -513,8 +607,7 @@ def go_tab(demo: gr.Blocks):
                     left_task_num = len(files) - idx
                     assigned_proxies = split_proxies(https_proxy_list, left_task_num)
 
-                buy_new_terminal(
-                    endpoint_url=demo.local_url,
+                task = dict(
                     filename=filename,
                     tickets_info_str=content,
                     time_start=time_start,
@@ -528,8 +621,22 @@ def go_tab(demo: gr.Blocks):
                     ntfy_username=ConfigDB.get("ntfyUsername"),
                     ntfy_password=ConfigDB.get("ntfyPassword"),
                     https_proxys=",".join(assigned_proxies[assigned_proxies_next_idx]),
+                    concurrency=concurrency,
+                    prearm_seconds=prearm_seconds,
+                    burst_offsets=burst_offsets,
+                    http2=http2,
+                    solver_url=solver_url,
+                    proxy_file=proxy_file,
                 )
+                if single_process:
+                    local_tasks.append(task)
+                else:
+                    buy_new_terminal(
+                        endpoint_url=demo.local_url, headless=headless, **task
+                    )
                 assigned_proxies_next_idx += 1
+        if local_tasks:
+            buy_multi_terminal(demo.local_url, local_tasks)
         gr.Info("正在启动，请等待抢票页面弹出。")
 
     def start_process(
@@ -540,6 +647,14 @@ def go_tab(demo: gr.Blocks):
             total_attempts,
             audio_path,
             https_proxys,
+            concurrency,
+            prearm_seconds,
+            burst_offsets,
+            http2,
+            single_process,
+            headless,
+            shared_solver,
+            auto_proxy,
             progress=gr.Progress(),
     ):
         """
@@ -559,6 +674,16 @@ def go_tab(demo: gr.Blocks):
         https_proxy_list = ["none"] + https_proxys.split(",")
         assigned_proxies: list[list[str]] = []
         assigned_proxies_next_idx = 0
+        local_tasks: list[dict] = []
+        # 单进程时模型本来就只加载一次，不需要过码服务
+        solver_url = (
+            start_solver_terminal() if shared_solver and not single_process else ""
+        )
+        proxy_file = (
+            start_proxy_daemon_terminal(int(ConfigDB.get("kuaidaili_num") or 5))
+            if auto_proxy
+            else ""
+        )
         for idx, filename in enumerate(files):
             with open(filename, "r", encoding="utf-8") as file:
                 content = file.read()
@@ -581,6 +706,10 @@ def go_tab(demo: gr.Blocks):
                         "ntfy_url": ConfigDB.get("ntfyUrl"),
                         "ntfy_username": ConfigDB.get("ntfyUsername"),
                         "ntfy_password": ConfigDB.get("ntfyPassword"),
+                        "concurrency": concurrency,
+                        "prearm_seconds": prearm_seconds,
+                        "burst_offsets": burst_offsets,
+                        "http2": http2,
                     },
                 )
                 endpoints_next_idx += 1
@@ -592,8 +721,7 @@ def go_tab(demo: gr.Blocks):
                     left_task_num = len(files) - idx
                     assigned_proxies = split_proxies(https_proxy_list, left_task_num)
 
-                buy_new_terminal(
-                    endpoint_url=demo.local_url,
+                task = dict(
                     filename=filename,
                     tickets_info_str=content,
                     time_start=time_start,
@@ -607,8 +735,22 @@ def go_tab(demo: gr.Blocks):
                     ntfy_username=ConfigDB.get("ntfyUsername"),
                     ntfy_password=ConfigDB.get("ntfyPassword"),
                     https_proxys=",".join(assigned_proxies[assigned_proxies_next_idx]),
+                    concurrency=concurrency,
+                    prearm_seconds=prearm_seconds,
+                    burst_offsets=burst_offsets,
+                    http2=http2,
+                    solver_url=solver_url,
+                    proxy_file=proxy_file,
                 )
+                if single_process:
+                    local_tasks.append(task)
+                else:
+                    buy_new_terminal(
+                        endpoint_url=demo.local_url, headless=headless, **task
+                    )
                 assigned_proxies_next_idx += 1
+        if local_tasks:
+            buy_multi_terminal(demo.local_url, local_tasks)
         gr.Info("正在启动，请等待抢票页面弹出。")
 
     mode_ui.change(
@@ -646,6 +788,19 @@ def go_tab(demo: gr.Blocks):
         api_name="report",
     )
 
+    def report_buy(end_point, detail):
+        GlobalStatusInstance.buy_details[end_point] = Endpoint(
+            endpoint=end_point, detail=detail, update_at=time.time()
+        )
+
+    # 无界面抢票进程用 requests 直接 POST /run/report_buy，不经过队列
+    _report_tmp.click(
+        fn=report_buy,
+        inputs=[_end_point_tinput, _time_tmp],  # fake useage
+        api_name="report_buy",
+        queue=False,
+    )
+
     def tick():
         return f"当前时间戳：{int(time.time())}"
 
@@ -654,7 +809,10 @@ def go_tab(demo: gr.Blocks):
 
     @gr.render(inputs=timer)
     def show_split(text):
-        endpoints = GlobalStatusInstance.available_endpoints()
+        endpoints = (
+            GlobalStatusInstance.available_endpoints()
+            + GlobalStatusInstance.running_buys()
+        )
         if len(endpoints) == 0:
             gr.Markdown("## 无运行终端")
         else:
@@ -676,6 +834,14 @@ def go_tab(demo: gr.Blocks):
             total_attempts_ui,
             audio_path_ui,
             https_proxy_ui,
+            concurrency_ui,
+            prearm_seconds_ui,
+            burst_offsets_ui,
+            http2_ui,
+            single_process_ui,
+            headless_ui,
+            shared_solver_ui,
+            auto_proxy_ui,
         ],
     )
     process_btn.click(
@@ -688,6 +854,14 @@ def go_tab(demo: gr.Blocks):
             total_attempts_ui,
             audio_path_ui,
             https_proxy_ui,
+            concurrency_ui,
+            prearm_seconds_ui,
+            burst_offsets_ui,
+            http2_ui,
+            single_process_ui,
+            headless_ui,
+            shared_solver_ui,
+            auto_proxy_ui,
         ],
         outputs=process_btn,
     )
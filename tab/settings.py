@@ -258,7 +258,7 @@ def upload_file(filepath):
 
 
 def add():
-    main_request.cookieManager.db.delete("cookie")
+    main_request.cookieManager.clear_cookies()
     gr.Info("已经注销，将打开浏览器，请在浏览器里面重新登录", duration=5)
     yield [
         gr.update(value="未登录"),
@@ -38,7 +38,7 @@ def train_tab():
         test_csrf = _request.cookieManager.get_cookies_value("bili_jct")
         test_geetest_validate = ""
         test_geetest_seccode = ""
-        validator = ways_detail[select_way]
+        validator = ways_detail[select_way]()
         test_geetest_validate = validator.validate(gt=test_gt, challenge=test_challenge)
         test_geetest_seccode = test_geetest_validate + "|jordan"
 
@@ -1,31 +1,21 @@
-import importlib
+import asyncio
 import json
+import os
+import queue
 import subprocess
 import sys
+import threading
 import time
-from datetime import datetime
-from json import JSONDecodeError
-from urllib.parse import urlencode
+import uuid
 
-import qrcode
+import requests
 from loguru import logger
-from playsound3 import playsound
-from requests import HTTPError, RequestException
 
-from util import ERRNO_DICT, NtfyUtil, PushPlusUtil, ServerChanUtil, time_service
-from util import bili_ticket_gt_python
-from util.BiliRequest import BiliRequest
+from task.engine import BuyEngine
+from util import TEMP_PATH
+from util.BiliRequest import AsyncClientPool
 
-if bili_ticket_gt_python is not None:
-    Amort = importlib.import_module("geetest.TripleValidator").TripleValidator()
-
-
-def get_qrcode_url(_request, order_id) -> str:
-    url = f"https://show.bilibili.com/api/ticket/order/getPayParam?order_id={order_id}"
-    data = _request.get(url).json()
-    if data.get("errno", data.get("code")) == 0:
-        return data["data"]["code_url"]
-    raise ValueError("获取二维码失败")
+_STREAM_END = object()
 
 
 def buy_stream(
@@ -41,213 +31,65 @@ def buy_stream(
         ntfy_url=None,
         ntfy_username=None,
         ntfy_password=None,
+        concurrency=1,
+        prearm_seconds=0,
+        burst_offsets="",
+        http2=False,
+        solver_url="",
+        proxy_file="",
+        cancel_event: threading.Event | None = None,
 ):
-    if bili_ticket_gt_python is None:
-        yield "当前设备不支持本地过验证码，无法使用"
-        return
-
-    isRunning = True
-    left_time = total_attempts
-    tickets_info = json.loads(tickets_info_str)
-    cookies = tickets_info["cookies"]
-    phone = tickets_info.get("phone", None)
-    tickets_info.pop("cookies", None)
-    tickets_info["buyer_info"] = json.dumps(tickets_info["buyer_info"])
-    tickets_info["deliver_info"] = json.dumps(tickets_info["deliver_info"])
-    logger.info(f"使用代理：{https_proxys}")
-    _request = BiliRequest(cookies=cookies, proxy=https_proxys)
+    """
+    BuyEngine 的同步适配，在后台线程运行事件循环，逐条产出日志
 
-    token_payload = {
-        "count": tickets_info["count"],
-        "screen_id": tickets_info["screen_id"],
-        "order_type": 1,
-        "project_id": tickets_info["project_id"],
-        "sku_id": tickets_info["sku_id"],
-        "token": "",
-        "newRisk": True,
-    }
-
-    if time_start != "":
-        timeoffset = time_service.get_timeoffset()
-        yield "0) 等待开始时间"
-        yield f"时间偏差已被设置为: {timeoffset}s"
-        try:
-            time_difference = (
-                datetime.strptime(time_start, "%Y-%m-%dT%H:%M:%S").timestamp()
-                - time.time()
-                + timeoffset
-            )
-        except ValueError:
-            time_difference = (
-                datetime.strptime(time_start, "%Y-%m-%dT%H:%M").timestamp()
-                - time.time()
-                + timeoffset
-            )
-        start_time = time.perf_counter()
-        end_time = start_time + time_difference
-        while time.perf_counter() < end_time:
-            pass
+    调用方停止迭代或 cancel_event 被设置时会通知引擎退出，等待开票期间没有日志也能及时停止
+    """
+    messages: queue.Queue = queue.Queue()
+    engine = BuyEngine(
+        tickets_info_str,
+        time_start,
+        interval,
+        mode,
+        total_attempts,
+        audio_path,
+        pushplusToken,
+        serverchanKey,
+        https_proxys,
+        ntfy_url,
+        ntfy_username,
+        ntfy_password,
+        concurrency=concurrency,
+        prearm_seconds=prearm_seconds,
+        burst_offsets=burst_offsets,
+        http2=http2,
+        solver_url=solver_url,
+        proxy_file=proxy_file,
+        on_message=messages.put,
+    )
 
-    while isRunning:
+    def run_engine():
         try:
-            yield "1）订单准备"
-            request_result_normal = _request.post(
-                url=f"https://show.bilibili.com/api/ticket/order/prepare?project_id={tickets_info['project_id']}",
-                data=token_payload,
-                isJson=True,
-            )
-            request_result = request_result_normal.json()
-            yield f"请求头: {request_result_normal.headers} // 请求体: {request_result}"
-            code = int(request_result.get("errno", request_result.get("code")))
-
-            if code == -401:
-                _url = "https://api.bilibili.com/x/gaia-vgate/v1/register"
-                _data = _request.post(
-                    _url,
-                    urlencode(request_result["data"]["ga_data"]["riskParams"]),
-                ).json()
-                yield f"验证码请求: {_data}"
-                csrf: str = _request.cookieManager.get_cookies_value("bili_jct")  # type: ignore
-                token: str = _data["data"]["token"]
-
-                if _data["data"]["type"] == "geetest":
-                    gt = _data["data"]["geetest"]["gt"]
-                    challenge: str = _data["data"]["geetest"]["challenge"]
-                    geetest_validate: str = Amort.validate(gt=gt, challenge=challenge)
-                    geetest_seccode: str = geetest_validate + "|jordan"
-                    yield f"geetest_validate: {geetest_validate},geetest_seccode: {geetest_seccode}"
-
-                    _url = "https://api.bilibili.com/x/gaia-vgate/v1/validate"
-                    _payload = {
-                        "challenge": challenge,
-                        "token": token,
-                        "seccode": geetest_seccode,
-                        "csrf": csrf,
-                        "validate": geetest_validate,
-                    }
-                    _data = _request.post(_url, urlencode(_payload)).json()
-                elif _data["data"]["type"] == "phone":
-                    _payload = {
-                        "code": phone,
-                        "csrf": csrf,
-                        "token": token,
-                    }
-                    _data = _request.post(_url, urlencode(_payload)).json()
-                else:
-                    yield "这是一个程序无法应对的验证码，脚本无法处理"
-                    break
-
-                yield f"validate: {_data}"
-                if int(_data.get("errno", _data.get("code"))) == 0:
-                    yield "验证码成功"
-                else:
-                    yield f"验证码失败 {_data}"
-                    continue
-
-                request_result = _request.post(
-                    url=f"https://show.bilibili.com/api/ticket/order/prepare?project_id={tickets_info['project_id']}",
-                    data=token_payload,
-                    isJson=True,
-                ).json()
-                yield f"prepare: {request_result}"
+            asyncio.run(engine.run())
+        except Exception as e:
+            logger.exception(e)
+            messages.put(f"程序异常: {repr(e)}")
+        finally:
+            messages.put(_STREAM_END)
 
-            tickets_info["again"] = 1
-            tickets_info["token"] = request_result["data"]["token"]
-            yield "2）创建订单"
-            tickets_info["timestamp"] = int(time.time()) * 100
-            payload = tickets_info
-            result = None
-            for attempt in range(1, 61):
-                if not isRunning:
-                    yield "抢票结束"
+    threading.Thread(target=run_engine, daemon=True).start()
+    try:
+        while True:
+            try:
+                msg = messages.get(timeout=0.5)
+            except queue.Empty:
+                if cancel_event is not None and cancel_event.is_set():
                     break
-                try:
-                    ret = _request.post(
-                        url=f"https://show.bilibili.com/api/ticket/order/createV2?project_id={tickets_info['project_id']}",
-                        data=payload,
-                        isJson=True,
-                    ).json()
-                    err = int(ret.get("errno", ret.get("code")))
-                    yield f"[尝试 {attempt}/60]  [{err}]({ERRNO_DICT.get(err, '未知错误码')}) | {ret}"
-
-                    if err == 100034:
-                        yield f"更新票价为：{ret['data']['pay_money'] / 100}"
-                        tickets_info["pay_money"] = ret["data"]["pay_money"]
-                        payload = tickets_info
-
-                    if err in [0, 100048, 100079]:
-                        yield "请求成功，停止重试"
-                        result = (ret, err)
-                        break
-
-                    if err == 100051:
-                        break
-
-                    time.sleep(interval / 1000)
-
-                except RequestException as e:
-                    yield f"[尝试 {attempt}/60] 请求异常: {e}"
-                    time.sleep(interval / 1000)
-
-                except Exception as e:
-                    yield f"[尝试 {attempt}/60] 未知异常: {e}"
-                    time.sleep(interval / 1000)
-            else:
-                yield "重试次数过多，重新准备订单"
-                continue
-            if result is None:
-                # if err == 100051:
-                yield "token过期，需要重新准备订单"
                 continue
-
-            request_result, errno = result
-            if errno == 0:
-                yield "3）抢票成功，弹出付款二维码"
-                qrcode_url = get_qrcode_url(
-                    _request,
-                    request_result["data"]["orderId"],
-                )
-                qr_gen = qrcode.QRCode()
-                qr_gen.add_data(qrcode_url)
-                qr_gen.make(fit=True)
-                qr_gen_image = qr_gen.make_image()
-                qr_gen_image.show()  # type: ignore
-                if pushplusToken:
-                    PushPlusUtil.send_message(
-                        pushplusToken, "抢票成功", "前往订单中心付款吧"
-                    )
-                if serverchanKey:
-                    ServerChanUtil.send_message(
-                        serverchanKey, "抢票成功", "前往订单中心付款吧"
-                    )
-                if ntfy_url:
-                    # 使用重复通知功能，每10秒发送一次，持续5分钟
-                    NtfyUtil.send_repeat_message(
-                        ntfy_url,
-                        f"抢票成功，bilibili会员购，请尽快前往订单中心付款",
-                        title="Bili Ticket Payment Reminder",
-                        username=ntfy_username,
-                        password=ntfy_password,
-                        interval_seconds=15,
-                        duration_minutes=5
-                    )
-                    yield "已启动重复通知，将每15秒发送一次提醒，持续5分钟"
-
-                if audio_path:
-                    playsound(audio_path)
+            if msg is _STREAM_END:
                 break
-            if mode == 1:
-                left_time -= 1
-                if left_time <= 0:
-                    break
-        except JSONDecodeError as e:
-            yield f"配置文件格式错误: {e}"
-        except HTTPError as e:
-            logger.exception(e)
-            yield f"请求错误: {e}"
-        except Exception as e:
-            logger.exception(e)
-            yield f"程序异常: {repr(e)}"
+            yield msg
+    finally:
+        engine.stop()
 
 
 def buy(
@@ -263,6 +105,12 @@ def buy(
         ntfy_url=None,
         ntfy_username=None,
         ntfy_password=None,
+        concurrency=1,
+        prearm_seconds=0,
+        burst_offsets="",
+        http2=False,
+        solver_url="",
+        proxy_file="",
 ):
     for msg in buy_stream(
             tickets_info_str,
@@ -277,6 +125,12 @@ def buy(
             ntfy_url,
             ntfy_username,
             ntfy_password,
+            concurrency,
+            prearm_seconds,
+            burst_offsets,
+            http2,
+            solver_url,
+            proxy_file,
     ):
         logger.info(msg)
 
@@ -296,6 +150,13 @@ def buy_new_terminal(
         ntfy_url=None,
         ntfy_username=None,
         ntfy_password=None,
+        concurrency=1,
+        prearm_seconds=0,
+        burst_offsets="",
+        http2=False,
+        solver_url="",
+        proxy_file="",
+        headless=False,
 ) -> subprocess.Popen:
     command = [sys.executable]
     if not getattr(sys, "frozen", False):
@@ -325,7 +186,133 @@ def buy_new_terminal(
         command.extend(["--ntfy_password", ntfy_password])
     if https_proxys:
         command.extend(["--https_proxys", https_proxys])
+    if concurrency and int(concurrency) > 1:
+        command.extend(["--concurrency", str(int(concurrency))])
+    if prearm_seconds and float(prearm_seconds) > 0:
+        command.extend(["--prearm_seconds", str(prearm_seconds)])
+    if burst_offsets:
+        command.extend(["--burst_offsets", burst_offsets])
+    if http2:
+        command.extend(["--http2", "true"])
+    if solver_url:
+        command.extend(["--solver_url", solver_url])
+    if proxy_file:
+        command.extend(["--proxy_file", proxy_file])
+    if headless:
+        command.extend(["--headless", "true"])
     command.extend(["--filename", filename])
     command.extend(["--endpoint_url", endpoint_url])
     proc = subprocess.Popen(command)
     return proc
+
+
+def start_solver_terminal(port: int | None = None, timeout: float = 60) -> str:
+    """
+    启动共享过码服务并等待模型加载完成，已经在运行时直接返回地址
+
+    服务启动失败时返回空字符串，抢票进程各自加载模型
+    """
+    from service.SolverService import DEFAULT_SOLVER_PORT
+
+    port = port or DEFAULT_SOLVER_PORT
+    url = f"http://127.0.0.1:{port}"
+    session = requests.Session()
+    session.trust_env = False
+
+    def healthy() -> bool:
+        try:
+            session.get(f"{url}/health", timeout=1).raise_for_status()
+            return True
+        except requests.RequestException:
+            return False
+
+    if healthy():
+        return url
+    command = [sys.executable]
+    if not getattr(sys, "frozen", False):
+        command.extend(["main.py"])
+    command.extend(["--port", str(port), "solver"])
+    proc = subprocess.Popen(command)
+    # 服务在模型加载完成后才开始监听，/health 可用时抢票进程才不会退回本地模型
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if healthy():
+            return url
+        if proc.poll() is not None:
+            logger.error(f"过码服务启动失败，退出码 {proc.returncode}")
+            return ""
+        time.sleep(0.5)
+    logger.warning(f"过码服务 {timeout:.0f} 秒内没有就绪，抢票进程过码失败时使用本地模型")
+    return url
+
+
+def start_proxy_daemon_terminal(target: int = 5, interval: float = 30) -> str:
+    """
+    启动代理补充进程，返回它写出的代理列表文件；存活标记最近刷新过说明已经在运行，不再重复启动
+    """
+    from util.ProxyReplenisher import PROXY_FILE, last_heartbeat
+
+    if time.time() - last_heartbeat(PROXY_FILE) < interval * 3:
+        return PROXY_FILE
+    command = [sys.executable]
+    if not getattr(sys, "frozen", False):
+        command.extend(["main.py"])
+    command.extend(
+        [
+            "proxies",
+            "--target",
+            str(target),
+            "--interval",
+            str(interval),
+            "--output",
+            PROXY_FILE,
+        ]
+    )
+    subprocess.Popen(command)
+    return PROXY_FILE
+
+
+def buy_multi(tasks: list[dict]):
+    """
+    在同一个进程、同一个事件循环里运行多个配置，共用验证码模型和每个代理的连接池
+
+    tasks 每一项是 BuyEngine 的参数，另加 filename，日志里的 extra["task"] 为文件名
+    """
+
+    async def run_all():
+        client_pool = AsyncClientPool(
+            max_connections=sum(max(10, int(t.get("concurrency", 1))) for t in tasks)
+        )
+
+        async def run_one(task: dict):
+            kwargs = dict(task)
+            name = os.path.basename(kwargs.pop("filename"))
+            with logger.contextualize(task=name):
+                engine = BuyEngine(**kwargs, client_pool=client_pool)
+                try:
+                    await engine.run()
+                except Exception as e:
+                    logger.exception(e)
+                logger.info(f"{name} 抢票结束")
+
+        try:
+            await asyncio.gather(*(run_one(task) for task in tasks))
+        finally:
+            await client_pool.aclose()
+
+    asyncio.run(run_all())
+
+
+def buy_multi_terminal(endpoint_url, tasks: list[dict]) -> subprocess.Popen:
+    """
+    启动一个进程运行全部配置，参数写到临时文件里传递
+    """
+    plan_path = os.path.join(TEMP_PATH, f"multi_{uuid.uuid1()}.json")
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump({"tasks": tasks}, f, ensure_ascii=False)
+    command = [sys.executable]
+    if not getattr(sys, "frozen", False):
+        command.extend(["main.py"])
+    command.extend(["multi", plan_path, "--endpoint_url", endpoint_url])
+    proc = subprocess.Popen(command)
+    return proc
@@ -0,0 +1,544 @@
+import asyncio
+import importlib
+import itertools
+import json
+import threading
+import time
+from datetime import datetime
+from json import JSONDecodeError
+from typing import Callable
+from urllib.parse import urlencode
+
+import httpx
+from loguru import logger
+
+from util import ERRNO_DICT, NtfyUtil, PushPlusUtil, ServerChanUtil, time_service
+from util import bili_ticket_gt_python
+from util.BiliRequest import AsyncBiliRequest, AsyncClientPool
+from util.ProxyReplenisher import ProxyFileWatcher
+from util.StartScheduler import StartScheduler, parse_burst_offsets
+from task.order import PreparedOrder
+
+
+def get_validator(solver_url: str = ""):
+    if solver_url:
+        # 使用共享的过码服务，服务不可用时才在本进程加载模型
+        return importlib.import_module("geetest.RemoteValidator").RemoteValidator(
+            solver_url
+        )
+    # 第一次调用时才导入 onnxruntime 并加载模型，进程内所有任务共用一个实例
+    return importlib.import_module("geetest.TripleValidator").get_validator()
+
+
+# createV2 返回这些错误码时认为下单成功
+SUCCESS_ERRNOS = (0, 100048, 100079)
+# 一个 token 最多尝试的 createV2 次数
+CREATE_ATTEMPTS = 60
+# 等待开票期间保活连接的间隔，要小于服务端 keep-alive 超时
+KEEP_HOT_INTERVAL = 20
+# 开票前多少秒做最后一次保活，之后不再占用连接
+KEEP_HOT_LEAD = 2
+# 检查代理补充器输出文件的间隔
+PROXY_FILE_POLL = 2
+
+
+class RetryExhausted(Exception):
+    pass
+
+
+class _UnsupportedCaptcha(Exception):
+    pass
+
+
+async def get_qrcode_url(_request: AsyncBiliRequest, order_id) -> str:
+    url = f"https://show.bilibili.com/api/ticket/order/getPayParam?order_id={order_id}"
+    data = (await _request.get(url)).json()
+    if data.get("errno", data.get("code")) == 0:
+        return data["data"]["code_url"]
+    raise ValueError("获取二维码失败")
+
+
+class BuyEngine:
+    """
+    asyncio 抢票引擎
+
+    每个 token 同时保持 concurrency 个 createV2 请求在途，每个请求结束后各自等待 interval 毫秒
+    """
+
+    def __init__(
+        self,
+        tickets_info_str,
+        time_start,
+        interval,
+        mode,
+        total_attempts,
+        audio_path,
+        pushplusToken,
+        serverchanKey,
+        https_proxys,
+        ntfy_url=None,
+        ntfy_username=None,
+        ntfy_password=None,
+        concurrency: int = 1,
+        prearm_seconds: float = 0,
+        burst_offsets: str = "",
+        http2: bool = False,
+        solver_url: str = "",
+        proxy_file: str = "",
+        client_pool: AsyncClientPool | None = None,
+        on_message: Callable[[str], None] = logger.info,
+    ):
+        self.tickets_info_str = tickets_info_str
+        self.time_start = time_start
+        self.interval = interval
+        self.mode = mode
+        self.total_attempts = total_attempts
+        self.audio_path = audio_path
+        self.pushplusToken = pushplusToken
+        self.serverchanKey = serverchanKey
+        self.https_proxys = https_proxys
+        self.ntfy_url = ntfy_url
+        self.ntfy_username = ntfy_username
+        self.ntfy_password = ntfy_password
+        self.concurrency = max(1, int(concurrency))
+        self.prearm_seconds = max(0.0, float(prearm_seconds))
+        self.burst_offsets = parse_burst_offsets(burst_offsets)
+        self.scheduler = StartScheduler(time_service)
+        self.http2 = http2
+        self.solver_url = solver_url
+        self.proxy_file = proxy_file
+        self.client_pool = client_pool
+        self.emit = on_message
+        self._stop_event = threading.Event()
+        # 等待开票阶段的任务和它所在的事件循环，stop 时直接取消
+        self._waiting: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return not self._stop_event.is_set()
+
+    def stop(self):
+        """
+        可以在其他线程调用；还在等待开票时立即退出，否则正在进行的请求结束后退出
+        """
+        self._stop_event.set()
+        waiting, loop = self._waiting, self._loop
+        if waiting is not None and loop is not None:
+            loop.call_soon_threadsafe(waiting.cancel)
+
+    async def run(self):
+        if bili_ticket_gt_python is None:
+            self.emit("当前设备不支持本地过验证码，无法使用")
+            return
+
+        left_time = self.total_attempts
+        tickets_info = json.loads(self.tickets_info_str)
+        cookies = tickets_info["cookies"]
+        self.phone = tickets_info.get("phone", None)
+        tickets_info.pop("cookies", None)
+        tickets_info["buyer_info"] = json.dumps(tickets_info["buyer_info"])
+        tickets_info["deliver_info"] = json.dumps(tickets_info["deliver_info"])
+        logger.info(f"使用代理：{self.https_proxys}")
+        self._request = AsyncBiliRequest(
+            cookies=cookies,
+            proxy=self.https_proxys,
+            max_connections=max(10, self.concurrency),
+            http2=self.http2,
+            client_pool=self.client_pool,
+        )
+        self.token_payload = {
+            "count": tickets_info["count"],
+            "screen_id": tickets_info["screen_id"],
+            "order_type": 1,
+            "project_id": tickets_info["project_id"],
+            "sku_id": tickets_info["sku_id"],
+            "token": "",
+            "newRisk": True,
+        }
+        tickets_info["again"] = 1
+        order = PreparedOrder(tickets_info)
+        # 模型在后台加载，和登录、等待开票并行
+        self._validator = asyncio.create_task(
+            asyncio.to_thread(get_validator, self.solver_url)
+        )
+        project_id = tickets_info["project_id"]
+        watch_proxies = (
+            asyncio.create_task(self.watch_proxies()) if self.proxy_file else None
+        )
+        try:
+            prearmed = None
+            start_timestamp: float | None = None
+            if self.time_start != "":
+                start_timestamp = self.parse_time_start()
+                self._loop = asyncio.get_running_loop()
+                self._waiting = asyncio.create_task(
+                    self.wait_for_start(start_timestamp, project_id)
+                )
+                if not self.is_running:
+                    self._waiting.cancel()
+                try:
+                    prearmed = await self._waiting
+                except asyncio.CancelledError:
+                    if self.is_running:
+                        raise
+                    self.emit("已停止")
+                    return
+                finally:
+                    self._waiting = None
+
+            while self.is_running:
+                try:
+                    if prearmed is not None:
+                        request_result, prearmed = prearmed, None
+                    else:
+                        self.emit("1）订单准备")
+                        request_result = await self.prepare(project_id)
+                        if request_result is None:
+                            continue
+
+                    order.update(
+                        token=request_result["data"]["token"],
+                        timestamp=int(time.time()) * 100,
+                    )
+                    self.emit("2）创建订单")
+                    try:
+                        if start_timestamp is not None:
+                            # 只有开票后的第一轮按计划突发
+                            start_at, start_timestamp = start_timestamp, None
+                            result = await self.create_orders(
+                                order,
+                                start_at=start_at,
+                                burst_at=[
+                                    start_at + offset for offset in self.burst_offsets
+                                ],
+                            )
+                        else:
+                            result = await self.create_orders(order)
+                    except RetryExhausted:
+                        self.emit("重试次数过多，重新准备订单")
+                        continue
+                    if result is None:
+                        self.emit("token过期，需要重新准备订单")
+                        continue
+
+                    request_result, errno = result
+                    if errno == 0:
+                        self.emit("3）抢票成功，弹出付款二维码")
+                        await self.on_success(request_result["data"]["orderId"])
+                        break
+                    if self.mode == 1:
+                        left_time -= 1
+                        if left_time <= 0:
+                            break
+                except _UnsupportedCaptcha:
+                    self.emit("这是一个程序无法应对的验证码，脚本无法处理")
+                    break
+                except JSONDecodeError as e:
+                    self.emit(f"配置文件格式错误: {e}")
+                except httpx.HTTPError as e:
+                    logger.exception(e)
+                    self.emit(f"请求错误: {e}")
+                except Exception as e:
+                    logger.exception(e)
+                    self.emit(f"程序异常: {repr(e)}")
+        finally:
+            if watch_proxies is not None:
+                watch_proxies.cancel()
+            await self._request.aclose()
+
+    def parse_time_start(self) -> float:
+        try:
+            return datetime.strptime(self.time_start, "%Y-%m-%dT%H:%M:%S").timestamp()
+        except ValueError:
+            return datetime.strptime(self.time_start, "%Y-%m-%dT%H:%M").timestamp()
+
+    async def wait_for_start(self, start_timestamp: float, project_id) -> dict | None:
+        """
+        等到开票时间，期间保活连接；开启提前准备时返回提前拿到的 token
+        """
+        # 等待期间定期重新校时，调度器每次醒来都会读取最新的偏差
+        time_service.start_background_sync()
+        await asyncio.to_thread(time_service.wait_synced, 10)
+        timeoffset = time_service.get_timeoffset()
+        uncertainty = time_service.get_uncertainty()
+        self.emit("0) 等待开始时间")
+        if uncertainty is None:
+            self.emit(f"时间偏差已被设置为: {timeoffset}s")
+        else:
+            self.emit(
+                f"时间偏差已被设置为: {timeoffset}s (误差约 ±{uncertainty * 1000:.1f}ms)"
+            )
+        prearmed = None
+        keep_hot = asyncio.create_task(self.keep_hot(start_timestamp))
+        try:
+            if self.prearm_seconds > 0:
+                await self.scheduler.async_wait_until(
+                    start_timestamp - self.prearm_seconds
+                )
+                prearmed = await self.prearm(project_id)
+            await self.scheduler.async_wait_until(
+                start_timestamp + min([0.0, *self.burst_offsets])
+            )
+        finally:
+            keep_hot.cancel()
+        return prearmed
+
+    async def keep_hot(self, start_timestamp: float):
+        """
+        等待开票期间预热并保活到每个 host、每个代理的连接，开票时的请求直接复用
+        """
+        # HTTP/2 下所有请求复用一条连接
+        connections = 1 if self.http2 else self.concurrency + len(self.burst_offsets)
+        while self.is_running:
+            result = await self._request.warmup(connections)
+            for (proxy, url), elapsed in result.items():
+                if elapsed == float("inf"):
+                    logger.warning(f"预热连接失败: {url} 代理 {proxy}")
+                else:
+                    logger.debug(f"预热连接 {url} 代理 {proxy} 耗时 {elapsed:.3f}s")
+            remaining = self.scheduler.remaining(start_timestamp) - KEEP_HOT_LEAD
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(KEEP_HOT_INTERVAL, remaining))
+
+    async def watch_proxies(self):
+        """
+        跟踪代理补充器写出的列表，替换代理池但保留仍在列表中的代理的统计
+        """
+        watcher = ProxyFileWatcher(self.proxy_file)
+        # 启动参数里有直连时一直保留
+        keep_direct = "none" in self._request.proxy_pool.proxies
+        while True:
+            proxies = await asyncio.to_thread(watcher.poll)
+            if proxies:
+                if keep_direct and "none" not in proxies:
+                    proxies.append("none")
+                removed = set(self._request.proxy_pool.proxies) - set(proxies)
+                self._request.proxy_pool.set_proxies(proxies)
+                # 多配置模式下连接池是共用的，只关闭被替换掉的代理的连接
+                for proxy in removed:
+                    await self._request.client_pool.evict(proxy)
+                logger.info(f"代理列表已更新，共 {len(proxies)} 个")
+            await asyncio.sleep(PROXY_FILE_POLL)
+
+    async def prearm(self, project_id) -> dict | None:
+        """
+        开票前提前拿到 prepare token 并过掉验证码，开票时直接 createV2
+
+        拿不到 token 时返回 None，开票后按原流程重新准备
+        """
+        self.emit(f"0.5) 提前 {self.prearm_seconds}s 准备订单")
+        try:
+            request_result = await self.prepare(project_id)
+        except Exception as e:
+            logger.exception(e)
+            self.emit(f"提前准备失败，开票后重新准备: {repr(e)}")
+            return None
+        if request_result is None or not (request_result.get("data") or {}).get(
+            "token"
+        ):
+            self.emit(f"提前准备未拿到 token，开票后重新准备: {request_result}")
+            return None
+        self.emit("提前准备完成，等待开票")
+        return request_result
+
+    async def prepare(self, project_id) -> dict | None:
+        """
+        获取下单 token，必要时过验证码；验证码失败返回 None
+        """
+        _request = self._request
+        prepare_url = f"https://show.bilibili.com/api/ticket/order/prepare?project_id={project_id}"
+        request_result_normal = await _request.post(
+            url=prepare_url, data=self.token_payload, isJson=True
+        )
+        request_result = request_result_normal.json()
+        self.emit(
+            f"请求头: {request_result_normal.headers} // 请求体: {request_result}"
+        )
+        code = int(request_result.get("errno", request_result.get("code")))
+        if code != -401:
+            return request_result
+
+        _url = "https://api.bilibili.com/x/gaia-vgate/v1/register"
+        _data = (
+            await _request.post(
+                _url, urlencode(request_result["data"]["ga_data"]["riskParams"])
+            )
+        ).json()
+        self.emit(f"验证码请求: {_data}")
+        csrf: str = _request.cookieManager.get_cookies_value("bili_jct")  # type: ignore
+        token: str = _data["data"]["token"]
+
+        if _data["data"]["type"] == "geetest":
+            gt = _data["data"]["geetest"]["gt"]
+            challenge: str = _data["data"]["geetest"]["challenge"]
+            validator = await self._validator
+            geetest_validate: str = await asyncio.to_thread(
+                validator.validate, gt=gt, challenge=challenge
+            )
+            geetest_seccode: str = geetest_validate + "|jordan"
+            self.emit(
+                f"geetest_validate: {geetest_validate},geetest_seccode: {geetest_seccode}"
+            )
+
+            _url = "https://api.bilibili.com/x/gaia-vgate/v1/validate"
+            _payload = {
+                "challenge": challenge,
+                "token": token,
+                "seccode": geetest_seccode,
+                "csrf": csrf,
+                "validate": geetest_validate,
+            }
+            _data = (await _request.post(_url, urlencode(_payload))).json()
+        elif _data["data"]["type"] == "phone":
+            _payload = {
+                "code": self.phone,
+                "csrf": csrf,
+                "token": token,
+            }
+            _data = (await _request.post(_url, urlencode(_payload))).json()
+        else:
+            raise _UnsupportedCaptcha()
+
+        self.emit(f"validate: {_data}")
+        if int(_data.get("errno", _data.get("code"))) == 0:
+            self.emit("验证码成功")
+        else:
+            self.emit(f"验证码失败 {_data}")
+            return None
+
+        request_result = (
+            await _request.post(url=prepare_url, data=self.token_payload, isJson=True)
+        ).json()
+        self.emit(f"prepare: {request_result}")
+        return request_result
+
+    async def create_orders(
+        self, order: PreparedOrder, start_at: float | None = None, burst_at=()
+    ) -> tuple[dict, int] | None:
+        """
+        用同一个 token 并发下单
+
+        start_at 不为空时常驻请求等到该时间才开始，burst_at 中的每个时间点额外单独发一次请求
+        成功返回 (响应, 错误码)，token 过期或被停止返回 None，次数用尽抛出 RetryExhausted
+        """
+        url = f"https://show.bilibili.com/api/ticket/order/createV2?project_id={self.token_payload['project_id']}"
+        headers = self._request.frozen_headers(isJson=True)
+        attempts = itertools.count(1)
+        done = asyncio.Event()
+        result: tuple[dict, int] | None = None
+
+        async def shoot(attempt):
+            nonlocal result
+            try:
+                ret = (
+                    await self._request.send("POST", url, order.body, headers)
+                ).json()
+                err = int(ret.get("errno", ret.get("code")))
+                self.emit(
+                    f"[尝试 {attempt}/{CREATE_ATTEMPTS}]  [{err}]({ERRNO_DICT.get(err, '未知错误码')}) | {ret}"
+                )
+
+                if err == 100034:
+                    self.emit(f"更新票价为：{ret['data']['pay_money'] / 100}")
+                    order.update(pay_money=ret["data"]["pay_money"])
+
+                if err in SUCCESS_ERRNOS:
+                    if result is None:
+                        self.emit("请求成功，停止重试")
+                        result = (ret, err)
+                    done.set()
+
+                if err == 100051:
+                    done.set()
+
+            except httpx.HTTPError as e:
+                self.emit(f"[尝试 {attempt}/{CREATE_ATTEMPTS}] 请求异常: {e}")
+
+            except Exception as e:
+                self.emit(f"[尝试 {attempt}/{CREATE_ATTEMPTS}] 未知异常: {e}")
+
+        async def burst_shot(at):
+            await self.scheduler.async_wait_until(at)
+            if done.is_set() or not self.is_running:
+                return
+            attempt = next(attempts)
+            if attempt <= CREATE_ATTEMPTS:
+                await shoot(attempt)
+
+        async def worker():
+            if start_at is not None:
+                await self.scheduler.async_wait_until(start_at)
+            while not done.is_set():
+                if not self.is_running:
+                    self.emit("抢票结束")
+                    done.set()
+                    return
+                attempt = next(attempts)
+                if attempt > CREATE_ATTEMPTS:
+                    return
+                await shoot(attempt)
+                if done.is_set():
+                    return
+                await asyncio.sleep(self.interval / 1000)
+
+        await asyncio.gather(
+            *(burst_shot(at) for at in burst_at),
+            *(worker() for _ in range(self.concurrency)),
+        )
+        if result is None and not done.is_set():
+            raise RetryExhausted()
+        return result
+
+    @staticmethod
+    def _show_qrcode(qrcode_url):
+        # 只在抢到票时用到，不拖慢启动
+        import qrcode
+
+        qr_gen = qrcode.QRCode()
+        qr_gen.add_data(qrcode_url)
+        qr_gen.make(fit=True)
+        qr_gen_image = qr_gen.make_image()
+        qr_gen_image.show()  # type: ignore
+
+    @staticmethod
+    def _play_audio(audio_path):
+        from playsound3 import playsound
+
+        playsound(audio_path)
+
+    async def on_success(self, order_id):
+        # 以下都是阻塞调用，放到线程里执行，同一事件循环里的其他任务不受影响
+        qrcode_url = await get_qrcode_url(self._request, order_id)
+        await asyncio.to_thread(self._show_qrcode, qrcode_url)
+        if self.pushplusToken:
+            await asyncio.to_thread(
+                PushPlusUtil.send_message,
+                self.pushplusToken,
+                "抢票成功",
+                "前往订单中心付款吧",
+            )
+        if self.serverchanKey:
+            await asyncio.to_thread(
+                ServerChanUtil.send_message,
+                self.serverchanKey,
+                "抢票成功",
+                "前往订单中心付款吧",
+            )
+        if self.ntfy_url:
+            # 使用重复通知功能，每10秒发送一次，持续5分钟
+            await asyncio.to_thread(
+                NtfyUtil.send_repeat_message,
+                self.ntfy_url,
+                "抢票成功，bilibili会员购，请尽快前往订单中心付款",
+                title="Bili Ticket Payment Reminder",
+                username=self.ntfy_username,
+                password=self.ntfy_password,
+                interval_seconds=15,
+                duration_minutes=5,
+            )
+            self.emit("已启动重复通知，将每15秒发送一次提醒，持续5分钟")
+
+        if self.audio_path:
+            await asyncio.to_thread(self._play_audio, self.audio_path)
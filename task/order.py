@@ -0,0 +1,41 @@
+import json
+
+
+class PreparedOrder:
+    """
+    预先序列化的 createV2 请求体
+
+    不变的字段只在构造时 json.dumps 一次，之后只重新拼接 token、timestamp、pay_money
+    """
+
+    DYNAMIC_FIELDS = ("token", "timestamp", "pay_money")
+
+    def __init__(self, tickets_info: dict):
+        static = {
+            k: v for k, v in tickets_info.items() if k not in self.DYNAMIC_FIELDS
+        }
+        self.fields = {
+            k: tickets_info[k] for k in self.DYNAMIC_FIELDS if k in tickets_info
+        }
+        # 去掉首尾的大括号，只保留 "k": v, ... 部分
+        self._static = json.dumps(static)[1:-1].encode()
+        self._body: bytes | None = None
+
+    def update(self, **fields):
+        for k, v in fields.items():
+            if k not in self.DYNAMIC_FIELDS:
+                raise KeyError(f"{k} 不是可更新的字段")
+            self.fields[k] = v
+        self._body = None
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            parts = [
+                f"{json.dumps(k)}: {json.dumps(v)}".encode()
+                for k, v in self.fields.items()
+            ]
+            if self._static:
+                parts.append(self._static)
+            self._body = b"{" + b", ".join(parts) + b"}"
+        return self._body
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+
+from geetest.TripleValidator import postprocess
+
+
+def postprocess_loop(outputs: np.ndarray, confidence_thres: float):
+    """
+    向量化之前 Model.detect 里的逐行实现
+    """
+    boxes, scores = [], []
+    for i in range(outputs.shape[0]):
+        classes_scores = outputs[i][4:]
+        max_score = np.amax(classes_scores)
+        if max_score >= confidence_thres:
+            x, y, w, h = outputs[i][0], outputs[i][1], outputs[i][2], outputs[i][3]
+            left = int((x - w / 2))
+            top = int((y - h / 2))
+            width = int(w)
+            height = int(h)
+            scores.append(max_score)
+            boxes.append([left, top, width, height])
+    return boxes, scores
+
+
+def random_outputs(rng: np.random.Generator, rows: int, classes: int = 1):
+    boxes = rng.uniform(-20, 400, (rows, 4))
+    boxes[:, 2:] = rng.uniform(1, 120, (rows, 2))
+    scores = rng.uniform(0, 1, (rows, classes))
+    return np.hstack([boxes, scores]).astype(np.float32)
+
+
+def assert_same(outputs: np.ndarray, confidence_thres: float = 0.8):
+    boxes, scores = postprocess(outputs, confidence_thres)
+    expected_boxes, expected_scores = postprocess_loop(outputs, confidence_thres)
+    assert boxes == expected_boxes
+    assert scores == [float(s) for s in expected_scores]
+    indices = cv2.dnn.NMSBoxes(boxes, scores, confidence_thres, 0.8)
+    expected = cv2.dnn.NMSBoxes(expected_boxes, expected_scores, confidence_thres, 0.8)
+    assert list(indices) == list(expected)
+
+
+def test_matches_loop_on_random_outputs():
+    rng = np.random.default_rng(20241018)
+    for _ in range(50):
+        assert_same(random_outputs(rng, int(rng.integers(1, 3000)), classes=2))
+
+
+def test_no_boxes_above_threshold():
+    outputs = random_outputs(np.random.default_rng(1), 100)
+    outputs[:, 4] = 0.5
+    assert postprocess(outputs, 0.8) == ([], [])
+    assert_same(outputs)
+
+
+def test_overlapping_boxes():
+    # 同一个位置附近的多个候选框，NMS 之后只应保留分数最高的
+    outputs = np.array(
+        [
+            [100.0, 100.0, 40.0, 40.0, 0.95],
+            [101.5, 99.5, 40.0, 41.0, 0.9],
+            [100.2, 100.7, 39.5, 40.0, 0.85],
+            [250.0, 80.0, 60.0, 60.0, 0.99],
+        ],
+        dtype=np.float32,
+    )
+    assert_same(outputs)
+    boxes, scores = postprocess(outputs, 0.8)
+    assert len(cv2.dnn.NMSBoxes(boxes, scores, 0.8, 0.5)) == 2
+
+
+def test_scale_maps_back_to_original_image():
+    outputs = random_outputs(np.random.default_rng(2), 200)
+    scaled = outputs.copy()
+    scaled[:, :4] /= 2
+    assert postprocess(outputs, 0.8, scale=2.0) == postprocess(scaled, 0.8)
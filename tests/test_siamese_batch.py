@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
+from scipy.special import softmax
+
+from geetest.TripleValidator import Model
+
+
+class StandInSiamese:
+    """
+    代替 triple.onnx 的会话：每张图独立地做固定的随机投影，batch 里各行互不影响
+    """
+
+    def __init__(self, size=(96, 96), dim: int = 64):
+        rng = np.random.default_rng(7)
+        self.weights = rng.standard_normal((3 * size[0] * size[1], dim)).astype(
+            np.float32
+        )
+        self.calls = 0
+
+    def run(self, _, inputs):
+        self.calls += 1
+        batch = inputs["input"]
+        return [np.tanh(batch.reshape(len(batch), -1) @ self.weights / 100)]
+
+
+def normalize_image_loop(img_np, mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)):
+    img_np = img_np.astype(np.float32) / 255.0
+    for i in range(3):
+        img_np[..., i] = (img_np[..., i] - mean[i]) / std[i]
+    return img_np
+
+
+def match_per_pair(model: Model, text_imgs, bg_imgs, bg_imgs_box):
+    """
+    批量推理之前的做法：每张图单独预处理、单独推理，再逐对计算相似度
+    """
+
+    def embed(img):
+        x = normalize_image_loop(cv2.resize(img, model.size)).transpose(2, 0, 1)
+        return model.siamese.run(None, {"input": x[np.newaxis]})[0][0]
+
+    text_embeddings = [embed(img) for img in text_imgs]
+    bg_embeddings = [embed(img) for img in bg_imgs]
+    similarity_matrix = np.array(
+        [
+            [1 - cdist([t], [b], metric="cosine")[0, 0] for b in bg_embeddings]
+            for t in text_embeddings
+        ]
+    )
+    similarity_matrix = softmax(similarity_matrix, axis=1)
+    mean_sim = similarity_matrix.mean(axis=1)
+    std_sim = similarity_matrix.std(axis=1)
+    similarity_matrix = (similarity_matrix - mean_sim) / std_sim
+    row_ind, col_ind = linear_sum_assignment(-similarity_matrix)
+    result_list = sorted(
+        [(i, bg_imgs_box[j]) for i, j in zip(row_ind, col_ind)], key=lambda x: x[0]
+    )
+    return result_list, [similarity_matrix[i, j] for i, j in zip(row_ind, col_ind)]
+
+
+def stand_in_model() -> Model:
+    model = Model.__new__(Model)
+    model.size = (96, 96)
+    model.siamese = StandInSiamese(model.size)
+    return model
+
+
+def random_crops(rng: np.random.Generator, n: int, low: int, high: int):
+    return [
+        rng.integers(0, 256, (rng.integers(low, high), rng.integers(low, high), 3))
+        .astype(np.uint8)
+        .astype(np.float32)
+        for _ in range(n)
+    ]
+
+
+def test_batched_match_equals_per_pair():
+    rng = np.random.default_rng(20241018)
+    model = stand_in_model()
+    for _ in range(20):
+        n = int(rng.integers(2, 6))
+        text_imgs = random_crops(rng, n, 20, 35)
+        bg_imgs = random_crops(rng, n, 40, 90)
+        bg_boxes = [[int(x), 0, 60, 60] for x in rng.integers(0, 300, n)]
+
+        model.siamese.calls = 0
+        result_list, scores = model.match(text_imgs, bg_imgs, bg_boxes)
+        assert model.siamese.calls == 1
+
+        expected_list, expected_scores = match_per_pair(
+            model, text_imgs, bg_imgs, bg_boxes
+        )
+        assert result_list == expected_list
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-4, atol=1e-5)
@@ -1,98 +1,135 @@
+import asyncio
+import importlib.util
+import itertools
 import json
 import time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
+import httpx
 import loguru
 import requests
 from util.CookieManager import CookieManager
+from util.ProxyPool import ProxyPool
+from util.RetryPolicy import Retrier, RetryPolicy, response_reason
+
+DEFAULT_HEADERS = {
+    "accept": "*/*",
+    "accept-language": "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6,zh-TW;q=0.5,ja;q=0.4",
+    "content-type": "application/x-www-form-urlencoded",
+    "cookie": "",
+    "referer": "https://show.bilibili.com/",
+    "priority": "u=1, i",
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 Edg/126.0.0.0",
+}
+
+# 抢票流程会访问的 host，开票前提前建立连接
+WARMUP_URLS = (
+    "https://show.bilibili.com/",
+    "https://api.bilibili.com/",
+)
+
+# 连接失败、超时等可以换代理重试的异常
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def retry_wait(proxy_pool: ProxyPool, reason: str, proxy: str) -> float | None:
+    """
+    重新登录后立即重试；412 只是当前代理被风控，有其他代理可用时立即换代理重试；其余按退避等待
+    """
+    if reason == "login":
+        return 0.0
+    if reason == "status:412" and proxy_pool.can_switch(proxy):
+        return 0.0
+    return None
 
 
 class BiliRequest:
     def __init__(
-        self, headers=None, cookies=None, cookies_config_path=None, proxy: str = "none"
+        self,
+        headers=None,
+        cookies=None,
+        cookies_config_path=None,
+        proxy: str = "none",
+        retry_policies: dict[str, RetryPolicy] | None = None,
     ):
         self.session = requests.Session()
-        self.proxy_list = proxy.split(",") if proxy else []
-        if len(self.proxy_list) == 0:
-            raise ValueError("at least have none proxy")
-        self.now_proxy_idx = 0
+        self.proxy_pool = ProxyPool(proxy.split(",") if proxy else [])
+        self.retrier = Retrier(retry_policies)
         self.cookieManager = CookieManager(cookies_config_path, cookies)
-        self.headers = headers or {
-            "accept": "*/*",
-            "accept-language": "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6,zh-TW;q=0.5,ja;q=0.4",
-            "content-type": "application/x-www-form-urlencoded",
-            "cookie": "",
-            "referer": "https://show.bilibili.com/",
-            "priority": "u=1, i",
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 Edg/126.0.0.0",
-        }
-        self.request_count = 0  # 记录请求次数
-
-    def count_and_sleep(self, threshold=60, sleep_time=60):
-        """
-        当记录到一定次数就sleap
-        """
-        self.request_count += 1
-        if self.request_count % threshold == 0:
-            loguru.logger.info(f"达到 {threshold} 次请求 412，休眠 {sleep_time} 秒")
-            time.sleep(sleep_time)
+        self.headers = headers or dict(DEFAULT_HEADERS)
 
-    def clear_request_count(self):
-        self.request_count = 0
+    def request(self, method, url, data=None, isJson=False, endpoint=None):
+        """
+        按接口类别的重试策略发送请求，endpoint 为空时根据 url 判断
 
-    def get(self, url, data=None, isJson=False):
+        重试次数用尽后 HTTP 错误状态抛出异常，业务错误码返回最后一次的响应
+        """
         self.headers["cookie"] = self.cookieManager.get_cookies_str()
         if isJson:
-            self.headers["Content-Type"] = "application/json"
+            self.headers["content-type"] = "application/json"
             data = json.dumps(data)
         else:
-            self.headers["Content-Type"] = "application/x-www-form-urlencoded"
-        response = self.session.get(url, data=data, headers=self.headers)
-        if response.status_code == 412:
-            self.count_and_sleep()
-            self.switch_proxy()
-            loguru.logger.warning(
-                f"412风控，切换代理到 {self.proxy_list[self.now_proxy_idx]}"
-            )
-            return self.get(url, data, isJson)
+            self.headers["content-type"] = "application/x-www-form-urlencoded"
+        policy = self.retrier.policy_for(url, endpoint)
+        relogged = False
+        for attempt in itertools.count(1):
+            try:
+                response, proxy = self._send(method, url, data)
+            except RETRYABLE_ERRORS as e:
+                delay = self.retrier.decide(policy, attempt, type(e).__name__)
+                if delay is None:
+                    raise
+            else:
+                reason = response_reason(policy, response)
+                if reason is None or (reason == "login" and relogged):
+                    break
+                wait = retry_wait(self.proxy_pool, reason, proxy)
+                if reason == "login":
+                    relogged = True
+                    self.headers["cookie"] = self.cookieManager.get_cookies_str_force()
+                delay = self.retrier.decide(policy, attempt, reason, proxy, wait)
+                if delay is None:
+                    break
+            if delay > 0:
+                time.sleep(delay)
         response.raise_for_status()
-        self.clear_request_count()
-        if response.json().get("msg", "") == "请先登录":
-            self.headers["cookie"] = self.cookieManager.get_cookies_str_force()
-            self.get(url, data)
         return response
 
-    def switch_proxy(self):
-        self.now_proxy_idx = (self.now_proxy_idx + 1) % len(self.proxy_list)
-        current_proxy = self.proxy_list[self.now_proxy_idx]
+    def get(self, url, data=None, isJson=False):
+        return self.request("GET", url, data, isJson)
 
-        if current_proxy == "none":
+    def _send(self, method, url, data):
+        """
+        通过当前最健康的代理发送请求，结果计入代理的健康度
+        """
+        proxy = self.proxy_pool.pick()
+        if proxy == "none":
             self.session.proxies = {}  # 不使用任何代理，直连
         else:
             self.session.proxies = {
-                "http": current_proxy,
-                "https": current_proxy,
+                "http": proxy,
+                "https": proxy,
             }
+        start = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, url, data=data, headers=self.headers
+            )
+        except Exception:
+            self.proxy_pool.record_failure(proxy, "error")
+            raise
+        if response.status_code == 412:
+            self.proxy_pool.record_failure(proxy, "412")
+        else:
+            self.proxy_pool.record_success(proxy, time.perf_counter() - start)
+        return response, proxy
 
     def post(self, url, data=None, isJson=False):
-        self.headers["cookie"] = self.cookieManager.get_cookies_str()
-        if isJson:
-            self.headers["content-type"] = "application/json"
-            data = json.dumps(data)
-        else:
-            self.headers["content-type"] = "application/x-www-form-urlencoded"
-        response = self.session.post(url, data=data, headers=self.headers)
-        if response.status_code == 412:
-            self.count_and_sleep()
-            self.switch_proxy()
-            loguru.logger.warning(
-                f"412风控，切换代理到 {self.proxy_list[self.now_proxy_idx]}"
-            )
-            return self.get(url, data, isJson)
-        response.raise_for_status()
-        self.clear_request_count()
-        if response.json().get("msg", "") == "请先登录":
-            self.headers["cookie"] = self.cookieManager.get_cookies_str_force()
-            self.post(url, data)
-        return response
+        return self.request("POST", url, data, isJson)
 
     def get_request_name(self):
         try:
@@ -104,3 +141,196 @@ class BiliRequest:
         except Exception as e:
             loguru.logger.exception(e)
             return "未登录"
+
+
+class AsyncClientPool:
+    """
+    按 (代理, 是否 HTTP/2) 缓存 httpx.AsyncClient，可以在同一事件循环里的多个 AsyncBiliRequest 之间共享
+    """
+
+    def __init__(self, max_connections: int = 10, timeout: float = 10.0):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._clients: dict[tuple[str, bool], httpx.AsyncClient] = {}
+
+    def get(self, proxy: str, http2: bool = False) -> httpx.AsyncClient:
+        client = self._clients.get((proxy, http2))
+        if client is None:
+            client = httpx.AsyncClient(
+                http2=http2,
+                proxy=None if proxy == "none" else proxy,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=self.timeout,
+                # cookie 统一由 CookieManager 放在请求头里，不让响应的 Set-Cookie 混进连接池
+                cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+            )
+            self._clients[(proxy, http2)] = client
+        return client
+
+    async def evict(self, proxy: str):
+        """
+        关闭并移除某个代理的客户端，代理被替换掉后调用，其余客户端不受影响
+        """
+        for key in [key for key in self._clients if key[0] == proxy]:
+            await self._clients.pop(key).aclose()
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+class AsyncBiliRequest:
+    """
+    BiliRequest 的 asyncio 版本，基于 httpx.AsyncClient
+
+    每个代理对应一个带连接池的 client，允许同一个配置同时有多个请求在途
+    开启 http2 时同一代理下的并发请求在一条连接上多路复用
+    传入 client_pool 时与其他实例共用连接池，由创建者负责关闭
+    """
+
+    def __init__(
+        self,
+        headers=None,
+        cookies=None,
+        cookies_config_path=None,
+        proxy: str = "none",
+        max_connections: int = 10,
+        timeout: float = 10.0,
+        http2: bool = False,
+        client_pool: AsyncClientPool | None = None,
+        retry_policies: dict[str, RetryPolicy] | None = None,
+    ):
+        self.proxy_pool = ProxyPool(proxy.split(",") if proxy else [])
+        self.retrier = Retrier(retry_policies)
+        self.cookieManager = CookieManager(cookies_config_path, cookies)
+        self.headers = headers or dict(DEFAULT_HEADERS)
+        if http2 and not http2_available():
+            loguru.logger.warning("未安装 h2，HTTP/2 不可用，退回 HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._own_pool = client_pool is None
+        self.client_pool = client_pool or AsyncClientPool(max_connections, timeout)
+
+    def get_client(self, proxy: str | None = None) -> httpx.AsyncClient:
+        proxy = proxy or self.proxy_pool.pick()
+        return self.client_pool.get(proxy, self.http2)
+
+    def frozen_headers(self, isJson=False) -> dict:
+        """
+        生成一份带 cookie 的完整请求头，配合 send 重复使用，避免每次请求重建
+        """
+        headers = dict(self.headers)
+        headers["cookie"] = self.cookieManager.get_cookies_str()
+        if isJson:
+            headers["content-type"] = "application/json"
+        else:
+            headers["content-type"] = "application/x-www-form-urlencoded"
+        return headers
+
+    async def request(
+        self, method, url, data=None, isJson=False, endpoint=None
+    ) -> httpx.Response:
+        if isJson:
+            data = json.dumps(data)
+        return await self.send(
+            method, url, data, self.frozen_headers(isJson), endpoint
+        )
+
+    async def send(
+        self, method, url, content, headers: dict, endpoint=None
+    ) -> httpx.Response:
+        """
+        发送已经序列化好的请求体，headers 不会被修改
+
+        按接口类别的重试策略重试，endpoint 为空时根据 url 判断；
+        重试次数用尽后 HTTP 错误状态抛出异常，业务错误码返回最后一次的响应
+        """
+        policy = self.retrier.policy_for(url, endpoint)
+        relogged = False
+        for attempt in itertools.count(1):
+            try:
+                response, proxy = await self._send_once(method, url, content, headers)
+            except httpx.TransportError as e:
+                delay = self.retrier.decide(policy, attempt, type(e).__name__)
+                if delay is None:
+                    raise
+            else:
+                reason = response_reason(policy, response)
+                if reason is None or (reason == "login" and relogged):
+                    break
+                wait = retry_wait(self.proxy_pool, reason, proxy)
+                if reason == "login":
+                    relogged = True
+                    headers = dict(headers)
+                    headers["cookie"] = await asyncio.to_thread(
+                        self.cookieManager.get_cookies_str_force
+                    )
+                delay = self.retrier.decide(policy, attempt, reason, proxy, wait)
+                if delay is None:
+                    break
+            if delay > 0:
+                await asyncio.sleep(delay)
+        response.raise_for_status()
+        return response
+
+    async def _send_once(self, method, url, content, headers):
+        """
+        通过当前最健康的代理发送一次请求，结果计入代理的健康度
+        """
+        proxy = self.proxy_pool.pick()
+        start = time.perf_counter()
+        try:
+            response = await self.get_client(proxy).request(
+                method, url, content=content, headers=headers
+            )
+        except httpx.HTTPError:
+            self.proxy_pool.record_failure(proxy, "error")
+            raise
+        if response.status_code == 412:
+            self.proxy_pool.record_failure(proxy, "412")
+        else:
+            self.proxy_pool.record_success(proxy, time.perf_counter() - start)
+        return response, proxy
+
+    async def get(self, url, data=None, isJson=False) -> httpx.Response:
+        return await self.request("GET", url, data, isJson)
+
+    async def post(self, url, data=None, isJson=False) -> httpx.Response:
+        return await self.request("POST", url, data, isJson)
+
+    async def warmup(self, connections: int = 1, urls=WARMUP_URLS) -> dict:
+        """
+        通过每个代理向每个 host 并发发送 connections 个 HEAD 请求，把连接池填满
+
+        返回 {(代理, url): 最慢一次的耗时}，失败的为 inf
+        """
+
+        async def head(proxy, url):
+            start = time.perf_counter()
+            try:
+                await self.get_client(proxy).head(url)
+                elapsed = time.perf_counter() - start
+                # 预热的耗时也作为代理的初始延迟
+                self.proxy_pool.record_success(proxy, elapsed)
+                return elapsed
+            except Exception as e:
+                loguru.logger.debug(f"预热连接失败 {proxy} {url}: {e}")
+                self.proxy_pool.record_failure(proxy, "error")
+                return float("inf")
+
+        targets = [(proxy, url) for proxy in self.proxy_pool.proxies for url in urls]
+        elapsed = await asyncio.gather(
+            *(head(proxy, url) for proxy, url in targets for _ in range(connections))
+        )
+        result: dict = {}
+        for i, target in enumerate(targets):
+            result[target] = max(elapsed[i * connections : (i + 1) * connections])
+        return result
+
+    async def aclose(self):
+        if self._own_pool:
+            await self.client_pool.aclose()
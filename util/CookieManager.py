@@ -1,18 +1,34 @@
 from loguru import logger
-from playwright.sync_api import sync_playwright
 from util.KVDatabase import KVDatabase
 
 
 class CookieManager:
     def __init__(self, config_file_path=None, cookies=None):
         self.db = KVDatabase(config_file_path)
+        # 请求头用的 cookie 字符串和 name -> value 字典，只在写入 cookie 时失效
+        self._cookies_str: str | None = None
+        self._cookies_dict: dict[str, str] | None = None
         if cookies is not None:
-            self.db.insert("cookie", cookies)
+            self.save_cookies(cookies)
+
+    def invalidate_cache(self):
+        self._cookies_str = None
+        self._cookies_dict = None
+
+    def save_cookies(self, cookies):
+        self.db.insert("cookie", cookies)
+        self.invalidate_cache()
+
+    def clear_cookies(self):
+        self.db.delete("cookie")
+        self.invalidate_cache()
 
     @logger.catch
     def _login_and_save_cookies(
         self, login_url="https://show.bilibili.com/platform/home.html"
     ):
+        from playwright.sync_api import sync_playwright
+
         logger.info("启动浏览器中，第一次启动会比较慢，请使用在浏览器登录")
         with sync_playwright() as p:
             try:
@@ -23,7 +39,7 @@ class CookieManager:
                 logger.info("浏览器启动, 进行登录.")
                 page.wait_for_selector(".user-center-link", timeout=0, state="attached")
                 cookies = page.context.cookies()
-                self.db.insert("cookie", cookies)
+                self.save_cookies(cookies)
                 browser.close()
                 logger.info("登录成功, 浏览器退出.")
                 return self.db.get("cookie")
@@ -43,20 +59,24 @@ class CookieManager:
         return self.db.contains("cookie")
 
     def get_cookies_str(self):
-        cookies = self.get_cookies()
-        cookies_str = ""
-        assert cookies
-        for cookie in cookies:
-            cookies_str += cookie["name"] + "=" + cookie["value"] + "; "
-        return cookies_str
+        if self._cookies_str is None:
+            cookies = self.get_cookies()
+            assert cookies
+            self._cookies_str = "".join(
+                cookie["name"] + "=" + cookie["value"] + "; " for cookie in cookies
+            )
+        return self._cookies_str
 
     def get_cookies_value(self, name):
-        cookies = self.get_cookies()
-        assert cookies
-        for cookie in cookies:
-            if cookie["name"] == name:
-                return cookie["value"]
-        return None
+        if self._cookies_dict is None:
+            cookies = self.get_cookies()
+            assert cookies
+            cookies_dict: dict[str, str] = {}
+            for cookie in cookies:
+                # 同名 cookie 以第一个为准
+                cookies_dict.setdefault(cookie["name"], cookie["value"])
+            self._cookies_dict = cookies_dict
+        return self._cookies_dict.get(name)
 
     def get_config_value(self, name, default=None):
         if self.db.contains(name):
@@ -66,6 +86,8 @@ class CookieManager:
 
     def set_config_value(self, name, value):
         self.db.insert(name, value)
+        if name == "cookie":
+            self.invalidate_cache()
 
     def get_cookies_str_force(self):
         self._login_and_save_cookies()
@@ -1,35 +1,255 @@
-from tinydb import TinyDB, Query
-from tinydb.storages import MemoryStorage
-from tinydb.storages import JSONStorage
+import copy
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
 
+from loguru import logger
 
-class KVDatabase:
-    def __init__(self, db_path):
-        if db_path is None:
-            self.db = TinyDB(storage=MemoryStorage)
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+@contextmanager
+def file_lock(lock_path: str):
+    """
+    跨进程的排他文件锁，多个抢票进程共用 config.json / cookies.json 时串行写入
+    """
+    with open(lock_path, "a+b") as f:
+        if sys.platform == "win32":
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 最多重试 10 秒，继续等待
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
         else:
-            self.db = TinyDB(db_path, storage=JSONStorage)
-        self.KeyValue = Query()
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.data: dict = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def contains(self, key):
+        return key in self.data
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+class JsonFileBackend:
+    """
+    兼容 TinyDB JSONStorage 格式的 JSON 文件
+
+    读操作只在文件的 mtime/size 变化时才重新解析，写操作持有文件锁，
+    先合并其他进程的修改再写入临时文件并原子替换
+    """
+
+    TABLE = "_default"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.lock = threading.Lock()
+        self.data: dict = {}
+        self._stat: tuple[int, int, int] | None = None
+        if not os.path.exists(path):
+            # 与 TinyDB 一致，打开时就创建文件
+            with self._modify():
+                pass
+
+    def _file_stat(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # 原子替换后 inode 会变化，即使 mtime 精度不够也能发现
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _reload(self):
+        stat = self._file_stat()
+        if stat == self._stat:
+            return
+        data = {}
+        if stat is not None and stat[1] > 0:
+            with open(self.path, "r", encoding="utf-8") as f:
+                content = json.load(f)
+            for doc in content.get(self.TABLE, {}).values():
+                data[doc["key"]] = doc["value"]
+        self.data = data
+        self._stat = stat
+
+    def _write(self):
+        content = {
+            self.TABLE: {
+                str(idx): {"key": key, "value": value}
+                for idx, (key, value) in enumerate(self.data.items(), start=1)
+            }
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(content, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        for i in range(10):
+            try:
+                os.replace(tmp_path, self.path)
+                break
+            except PermissionError:
+                # Windows 下其他进程正在读取时无法替换，稍后重试
+                if i == 9:
+                    raise
+                time.sleep(0.05)
+        self._stat = self._file_stat()
+
+    @contextmanager
+    def _modify(self):
+        with self.lock, file_lock(self.lock_path):
+            self._stat = None
+            self._reload()
+            yield
+            self._write()
+
+    def get(self, key):
+        with self.lock:
+            self._reload()
+            return self.data.get(key)
+
+    def contains(self, key):
+        with self.lock:
+            self._reload()
+            return key in self.data
+
+    def set(self, key, value):
+        with self._modify():
+            self.data[key] = value
+
+    def delete(self, key):
+        with self._modify():
+            self.data.pop(key, None)
+
+
+class SqliteBackend:
+    """
+    SQLite 存储，WAL 模式，依赖 SQLite 自身的锁保证多进程安全
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM kv WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def contains(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM kv WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def set(self, key, value):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO kv (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, json.dumps(value, ensure_ascii=False)),
+            )
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM kv LIMIT 1").fetchone() is None
+
+
+def create_backend(db_path, backend: str | None = None):
+    """
+    backend 可选 json / sqlite，默认读取环境变量 BTB_KV_BACKEND，未设置时为 json
+    """
+    if db_path is None:
+        return MemoryBackend()
+    backend = backend or os.environ.get("BTB_KV_BACKEND", "json")
+    if backend == "json":
+        return JsonFileBackend(db_path)
+    if backend == "sqlite":
+        root, ext = os.path.splitext(db_path)
+        sqlite_path = db_path if ext in (".db", ".sqlite") else root + ".sqlite"
+        sqlite_backend = SqliteBackend(sqlite_path)
+        # 第一次切换到 sqlite 时导入原有的 JSON 数据
+        if (
+            sqlite_path != db_path
+            and os.path.exists(db_path)
+            and sqlite_backend.is_empty()
+        ):
+            json_backend = JsonFileBackend(db_path)
+            json_backend._reload()
+            for key, value in json_backend.data.items():
+                sqlite_backend.set(key, value)
+            logger.info(
+                f"已从 {db_path} 导入 {len(json_backend.data)} 条数据到 {sqlite_path}"
+            )
+        return sqlite_backend
+    raise ValueError(f"未知的 KVDatabase 存储类型: {backend}")
+
+
+class KVDatabase:
+    def __init__(self, db_path, backend: str | None = None):
+        self.db = create_backend(db_path, backend)
 
     def insert(self, key, value):
         # 如果键已经存在，更新其值；否则插入新键值对
-        if self.db.contains(self.KeyValue.key == key):
-            self.db.update({"value": value}, self.KeyValue.key == key)
-        else:
-            self.db.insert({"key": key, "value": value})
+        self.db.set(key, value)
 
     def get(self, key):
-        result = self.db.get(self.KeyValue.key == key)
-        return result["value"] if result else None  # type: ignore
+        # 返回副本，调用方修改返回值不会影响缓存
+        return copy.deepcopy(self.db.get(key))
 
     def update(self, key, value):
-        if self.db.contains(self.KeyValue.key == key):
-            self.db.update({"value": value}, self.KeyValue.key == key)
+        if self.db.contains(key):
+            self.db.set(key, value)
         else:
             raise KeyError(f"Key '{key}' not found in database.")
 
     def delete(self, key):
-        self.db.remove(self.KeyValue.key == key)
+        self.db.delete(key)
 
     def contains(self, key):
-        return self.db.contains(self.KeyValue.key == key)
+        return self.db.contains(key)
@@ -0,0 +1,200 @@
+import threading
+import time
+from dataclasses import dataclass
+
+import loguru
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass
+class ProxyStats:
+    proxy: str
+    latency: float | None = None  # EWMA，秒
+    error_rate: float = 0.0  # 网络错误的 EWMA
+    rate_412: float = 0.0  # 412 的 EWMA
+    requests: int = 0
+    consecutive_failures: int = 0
+    last_failure: float = 0.0
+    state: str = CLOSED
+    open_until: float = 0.0
+    open_seconds: float = 0.0  # 最近一次熔断的时长，半开探测失败时翻倍
+    probing: bool = False
+    probe_started: float = 0.0
+    cooldown_412: float = 0.0  # 下一次 412 的冷却时长，连续 412 时翻倍，成功后减半
+
+    def score(self, default_latency: float) -> float:
+        """
+        越小越好，延迟按错误率和 412 率加权
+        """
+        latency = default_latency if self.latency is None else self.latency
+        return latency * (1 + 4 * self.error_rate + 4 * self.rate_412)
+
+
+class ProxyPool:
+    """
+    按健康度选代理
+
+    每个代理记录延迟、错误率、412 率的指数滑动平均，每次请求选分数最好的可用代理。
+    连续失败 failure_threshold 次后熔断 open_seconds 秒，到期后进入半开状态，
+    只放行一个探测请求，成功则恢复，失败则熔断时间翻倍(最多 max_open_seconds)。
+
+    412 只说明这个代理被风控，立即让它冷却，其余代理继续使用；冷却时长从 cooldown_412
+    开始，同一代理连续 412 时翻倍(最多 max_cooldown_412)，请求成功后逐步减半。
+    没有其他可用代理时不冷却，也不翻倍，由调用方退避后继续使用它
+    """
+
+    PROBE_TIMEOUT = 30
+
+    def __init__(
+        self,
+        proxies: list[str],
+        alpha: float = 0.3,
+        failure_threshold: int = 3,
+        open_seconds: float = 10,
+        max_open_seconds: float = 300,
+        cooldown_412: float = 5,
+        max_cooldown_412: float = 120,
+    ):
+        if not proxies:
+            raise ValueError("at least have none proxy")
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.base_cooldown_412 = cooldown_412
+        self.max_cooldown_412 = max_cooldown_412
+        self.lock = threading.Lock()
+        self.stats: dict[str, ProxyStats] = {}
+        self.set_proxies(proxies)
+
+    @property
+    def proxies(self) -> list[str]:
+        return list(self.stats)
+
+    def set_proxies(self, proxies: list[str]):
+        """
+        替换代理列表，保留仍在列表中的代理的统计
+        """
+        with self.lock:
+            self.stats = {p: self.stats.get(p) or ProxyStats(p) for p in proxies}
+
+    def _default_latency(self) -> float:
+        # 没有测过的代理按已知代理的中位延迟估计，让它们也有机会被选中
+        known = sorted(s.latency for s in self.stats.values() if s.latency is not None)
+        return known[len(known) // 2] if known else 1.0
+
+    def _available(self, stats: ProxyStats, now: float) -> bool:
+        if stats.state == CLOSED:
+            return True
+        if stats.state == OPEN and now >= stats.open_until:
+            stats.state = HALF_OPEN
+            stats.probing = False
+        if stats.probing and now - stats.probe_started > self.PROBE_TIMEOUT:
+            # 探测请求被取消、没有回报结果
+            stats.probing = False
+        return stats.state == HALF_OPEN and not stats.probing
+
+    def _others_available(self, stats: ProxyStats, now: float) -> bool:
+        return any(
+            self._available(s, now) for s in self.stats.values() if s is not stats
+        )
+
+    def pick(self) -> str:
+        """
+        返回当前最好的可用代理；全部熔断时返回最早恢复的一个，调用方不需要再等待
+        """
+        with self.lock:
+            now = time.time()
+            available = [s for s in self.stats.values() if self._available(s, now)]
+            if not available:
+                return min(self.stats.values(), key=lambda s: s.open_until).proxy
+            default_latency = self._default_latency()
+            best = min(available, key=lambda s: s.score(default_latency))
+            if best.state == HALF_OPEN:
+                best.probing = True
+                best.probe_started = now
+            return best.proxy
+
+    def _ewma(self, old: float, value: float) -> float:
+        return old + self.alpha * (value - old)
+
+    def record_success(self, proxy: str, latency: float):
+        with self.lock:
+            stats = self.stats.get(proxy)
+            if stats is None:
+                return
+            stats.requests += 1
+            stats.latency = (
+                latency if stats.latency is None else self._ewma(stats.latency, latency)
+            )
+            stats.error_rate = self._ewma(stats.error_rate, 0)
+            stats.rate_412 = self._ewma(stats.rate_412, 0)
+            stats.consecutive_failures = 0
+            if stats.state != CLOSED:
+                loguru.logger.info(f"代理 {proxy} 恢复")
+            stats.state = CLOSED
+            stats.probing = False
+            stats.open_seconds = 0
+            stats.cooldown_412 /= 2
+            if stats.cooldown_412 < self.base_cooldown_412:
+                stats.cooldown_412 = 0
+
+    def record_failure(self, proxy: str, kind: str = "error"):
+        """
+        kind 为 error(网络错误、超时) 或 412
+        """
+        with self.lock:
+            stats = self.stats.get(proxy)
+            if stats is None:
+                return
+            now = time.time()
+            stats.requests += 1
+            stats.last_failure = now
+            stats.consecutive_failures += 1
+            stats.error_rate = self._ewma(stats.error_rate, kind == "error")
+            stats.rate_412 = self._ewma(stats.rate_412, kind == "412")
+            if kind == "412":
+                self._cool_down(stats, now)
+            elif (
+                stats.state == HALF_OPEN
+                or stats.consecutive_failures >= self.failure_threshold
+            ):
+                self._open(stats, now)
+
+    def _open(self, stats: ProxyStats, now: float):
+        if stats.state == HALF_OPEN:
+            stats.open_seconds = min(self.max_open_seconds, stats.open_seconds * 2)
+        else:
+            stats.open_seconds = self.base_open_seconds
+        stats.state = OPEN
+        stats.probing = False
+        stats.open_until = now + stats.open_seconds
+        loguru.logger.warning(f"代理 {stats.proxy} 熔断 {stats.open_seconds:.0f} 秒")
+
+    def _cool_down(self, stats: ProxyStats, now: float):
+        if not self._others_available(stats, now):
+            loguru.logger.debug(f"代理 {stats.proxy} 412风控，没有其他可用代理，不冷却")
+            return
+        stats.cooldown_412 = min(
+            self.max_cooldown_412,
+            max(self.base_cooldown_412, stats.cooldown_412 * 2),
+        )
+        stats.state = OPEN
+        stats.probing = False
+        # 并发请求可能同时收到 412，不缩短已有的冷却
+        stats.open_until = max(stats.open_until, now + stats.cooldown_412)
+        stats.open_seconds = max(stats.open_seconds, stats.cooldown_412)
+        loguru.logger.warning(
+            f"代理 {stats.proxy} 412风控，冷却 {stats.cooldown_412:.0f} 秒"
+        )
+
+    def can_switch(self, proxy: str) -> bool:
+        """
+        除 proxy 外是否还有可用的代理
+        """
+        with self.lock:
+            stats = self.stats.get(proxy)
+            return self._others_available(stats, time.time())
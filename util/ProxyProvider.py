@@ -1,9 +1,22 @@
 # util/ProxyProvider.py
+import hashlib
+import os
+import threading
 import requests
 import time
+from collections.abc import Iterable, Iterator
 from loguru import logger
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from util import EXE_PATH
+from util.KVDatabase import KVDatabase
+
+# 检测结果在这段时间内直接复用，单位秒，设为 0 关闭缓存
+PROBE_TTL = float(os.environ.get("BTB_PROXY_PROBE_TTL", 300))
+PROBE_WORKERS = 16
+# 快代理私密代理(DPS)提取接口，测试时可以指向本地的替身服务
+KDL_API_URL = os.environ.get("BTB_KDL_API_URL", "https://dps.kdlapi.com/api/getdps/")
+
 def ping_proxy(proxy, test_url = "https://www.bilibili.com", timeout = 3.0):
     try:
         proxies = {"http": proxy, "https": proxy}  # 同时支持 HTTP 和 HTTPS 代理
@@ -28,7 +41,144 @@ def ping_proxy(proxy, test_url = "https://www.bilibili.com", timeout = 3.0):
     
     return float("inf")  # 如果请求失败，返回无效时间
 
-def get_proxies_from_kuaidaili(
+
+class ProbeCache:
+    """
+    代理检测结果的磁盘缓存，记录响应时间、检测时间和当时的超时
+
+    TTL 内再次检测同一代理直接返回缓存；失败的结果只在当时的超时不小于本次超时时复用
+    代理地址里可能带有账号密码，缓存文件里只保存地址的哈希
+    """
+
+    def __init__(self, path: str | None = None, ttl: float = PROBE_TTL):
+        self.ttl = ttl
+        self.db = KVDatabase(path)
+
+    @staticmethod
+    def key(proxy: str) -> str:
+        return hashlib.sha256(proxy.encode("utf-8")).hexdigest()
+
+    def get(self, proxy: str, timeout: float) -> float | None:
+        entry = self.db.get(self.key(proxy))
+        if not entry or time.time() - entry["checked_at"] > self.ttl:
+            return None
+        rtt = entry["rtt"]
+        if rtt is None:
+            return float("inf") if entry["timeout"] >= timeout else None
+        return rtt if rtt <= timeout else float("inf")
+
+    def put(self, proxy: str, rtt: float, timeout: float):
+        self.db.insert(
+            self.key(proxy),
+            {
+                "rtt": None if rtt == float("inf") else rtt,
+                "timeout": timeout,
+                "checked_at": time.time(),
+            },
+        )
+
+
+_probe_cache: ProbeCache | None = None
+_probe_cache_lock = threading.Lock()
+
+
+def get_probe_cache() -> ProbeCache | None:
+    """
+    进程内共用的检测缓存，保存在 EXE_PATH/proxy_probe.json，PROBE_TTL 为 0 时返回 None
+    """
+    global _probe_cache
+    if PROBE_TTL <= 0:
+        return None
+    with _probe_cache_lock:
+        if _probe_cache is None:
+            _probe_cache = ProbeCache(os.path.join(EXE_PATH, "proxy_probe.json"))
+        return _probe_cache
+
+
+def probe_proxies(
+    proxies: Iterable[str],
+    test_url = "https://www.bilibili.com",
+    timeout = 3.0,
+    max_workers = PROBE_WORKERS,
+    cache: ProbeCache | None = None,
+) -> Iterator[tuple[str, float]]:
+    """
+    并发检测代理，最多 max_workers 个同时进行，按完成顺序逐个产出 (代理, 响应时间)，不可用为 inf
+
+    缓存命中的代理最先产出，不再发请求；提前停止迭代时取消还没开始的检测
+    """
+    pending = []
+    for proxy in dict.fromkeys(proxies):
+        cached = cache.get(proxy, timeout) if cache else None
+        if cached is None:
+            pending.append(proxy)
+        else:
+            logger.debug(f"代理 {proxy} 使用缓存的检测结果")
+            yield proxy, cached
+    if not pending:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(pending)))
+    try:
+        future_to_proxy = {
+            executor.submit(ping_proxy, proxy, test_url, timeout): proxy
+            for proxy in pending
+        }
+        for future in as_completed(future_to_proxy):
+            proxy = future_to_proxy[future]
+            try:
+                rtt = future.result()
+            except Exception as e:
+                logger.error(f"代理 {proxy} 测试线程异常: {e}")
+                rtt = float("inf")
+            if cache:
+                cache.put(proxy, rtt, timeout)
+            yield proxy, rtt
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_kuaidaili(
+    signature,
+    secret_id,
+    username,
+    password,
+    num,
+    api_url = KDL_API_URL,
+) -> list[tuple[str, float | None]]:
+    """
+    从快代理提取一批代理，不做检测，返回 [(代理地址, 过期时间戳)]
+
+    请求时带上 f_et=1，接口会在每行后面附上剩余可用秒数；没有给出时过期时间为 None
+    """
+    params = {
+        "secret_id": secret_id,
+        "signature": signature,
+        "num": num,
+        "format": "text",
+        "sep": 1,
+        "f_et": 1,
+    }
+    resp = requests.get(api_url, params=params, timeout=5)
+    resp.raise_for_status()
+    now = time.time()
+    proxies = []
+    for line in resp.text.strip().splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.upper().startswith("ERROR") or ":" not in line:
+            raise ValueError(f"快代理返回错误: {resp.text[:200]}")
+        raw, _, seconds = line.partition(",")
+        try:
+            expires_at = now + float(seconds) if seconds else None
+        except ValueError:
+            expires_at = None
+        proxies.append((f"http://{username}:{password}@{raw}", expires_at))
+    return proxies
+
+
+def iter_proxies_from_kuaidaili(
     signature,
     secret_id,
     username,
@@ -37,64 +187,83 @@ def get_proxies_from_kuaidaili(
     batch_size = 10,
     max_attempts = 1000,
     max_workers = 10,
-    max_timeout = 3.0
-) -> list[str]:
-    url_template = (
-        "https://dps.kdlapi.com/api/getdps/"
-        "?secret_id={secret_id}&signature={signature}&num={batch}&format=text&sep=1"
-    )
-
-    usable_proxies = []
+    max_timeout = 3.0,
+    api_url = KDL_API_URL,
+) -> Iterator[tuple[str, float]]:
+    """
+    分批拉取并检测代理，逐个产出每个检测过的 (代理, 响应时间)，直到可用代理达到 num 个
+    """
+    usable = 0
     attempts = 0
+    cache = get_probe_cache()
 
-    while len(usable_proxies) < num and attempts < max_attempts:
-        url = url_template.format(secret_id=secret_id, signature=signature, batch=batch_size)
-        logger.info(f"尝试第 {attempts + 1} 次拉取代理: {url}")
+    while usable < num and attempts < max_attempts:
+        logger.info(f"尝试第 {attempts + 1} 次拉取代理: {api_url}")
 
         try:
-            resp = requests.get(url, timeout=5)
-            resp.raise_for_status()
-            raw_proxies = resp.text.strip().split("\r\n")
-
-            full_proxies = [f"http://{username}:{password}@{raw}" for raw in raw_proxies]
-
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_proxy = {executor.submit(ping_proxy, proxy, "https://www.bilibili.com", max_timeout): [proxy, max_timeout] for proxy in full_proxies}
-                logger.info(f"正在测试 {len(full_proxies)} 个代理，最大超时设置为 {max_timeout} 秒")
-                for future in as_completed(future_to_proxy):
-                    input = future_to_proxy[future]
-                    proxy = input[0]
-                    try:
-                        result = future.result()
-                        if result != float("inf"):
-                            usable_proxies.append(proxy)
-                            logger.info(f"第 {len(usable_proxies)}/{num} 个可用代理")
-                            if len(usable_proxies) >= num:
-                                break
-                    except Exception as e:
-                        logger.error(f"代理 {proxy} 测试线程异常: {e}")
+            full_proxies = [
+                proxy
+                for proxy, _ in fetch_kuaidaili(
+                    signature, secret_id, username, password, batch_size, api_url
+                )
+            ]
+
+            logger.info(f"正在测试 {len(full_proxies)} 个代理，最大超时设置为 {max_timeout} 秒")
+            for proxy, rtt in probe_proxies(
+                full_proxies, "https://www.bilibili.com", max_timeout, max_workers, cache
+            ):
+                yield proxy, rtt
+                if rtt != float("inf"):
+                    usable += 1
+                    logger.info(f"第 {usable}/{num} 个可用代理")
+                    if usable >= num:
+                        break
 
         except Exception as e:
             logger.error(f"拉取代理失败: {e}")
 
         attempts += 1
-        if len(usable_proxies) < num:
+        if usable < num:
             time.sleep(1)  # 避免被限频
 
-    if len(usable_proxies) < num:
-        logger.warning(f"仅获取到 {len(usable_proxies)} 个可用代理，目标为 {num}")
+    if usable < num:
+        logger.warning(f"仅获取到 {usable} 个可用代理，目标为 {num}")
     else:
-        logger.info(f"成功获取 {len(usable_proxies)} 个可用代理")
+        logger.info(f"成功获取 {usable} 个可用代理")
+
 
-    return usable_proxies
+def get_proxies_from_kuaidaili(
+    signature,
+    secret_id,
+    username,
+    password,
+    num,
+    batch_size = 10,
+    max_attempts = 1000,
+    max_workers = 10,
+    max_timeout = 3.0
+) -> list[str]:
+    return [
+        proxy
+        for proxy, rtt in iter_proxies_from_kuaidaili(
+            signature,
+            secret_id,
+            username,
+            password,
+            num,
+            batch_size,
+            max_attempts,
+            max_workers,
+            max_timeout,
+        )
+        if rtt != float("inf")
+    ]
 
 
 def filter_and_rank_proxies(proxy_list: list[str], max_rtt: float = 5.0) -> list[str]:
     results = []
-    for proxy in proxy_list:
-        if proxy.lower() == "none":
-            continue
-        rtt = ping_proxy(proxy)
+    candidates = [proxy for proxy in proxy_list if proxy.lower() != "none"]
+    for proxy, rtt in probe_proxies(candidates, cache=get_probe_cache()):
         if rtt != float("inf") and rtt <= max_rtt:
             logger.info(f"{proxy} 响应时间: {rtt:.2f}s")
             results.append((proxy, rtt))
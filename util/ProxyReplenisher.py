@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from loguru import logger
+
+from util import EXE_PATH
+from util.ProxyProvider import probe_proxies
+
+# 补充器写出、抢票进程监视的代理列表文件；代理地址里带有账号密码，文件只对当前用户可读写
+PROXY_FILE = os.path.join(EXE_PATH, "live_proxies.json")
+
+
+def write_proxy_file(path: str, proxies: list[str]):
+    """
+    先写临时文件再原子替换，读取方不会读到写了一半的文件
+
+    代理地址包含账号密码，抢票进程需要原样使用，不能像检测缓存那样只存哈希，
+    所以文件权限设为 0600；Windows 上权限位不起作用，只能依靠程序目录本身的权限
+    """
+    content = {"proxies": proxies, "updated_at": time.time()}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def heartbeat_path(path: str) -> str:
+    """
+    补充器每轮刷新的存活标记，和代理列表分开，抢票进程只读取列表
+    """
+    return f"{path}.alive"
+
+
+def last_heartbeat(path: str) -> float:
+    try:
+        return os.stat(heartbeat_path(path)).st_mtime
+    except OSError:
+        return 0.0
+
+
+def read_proxy_file(path: str) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ProxyFileWatcher:
+    """
+    抢票进程用来跟踪补充器写出的代理列表，列表内容变化时 poll 返回新列表，否则返回 None
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = 0
+        self._proxies: list[str] | None = None
+
+    def poll(self) -> list[str] | None:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime == self._mtime:
+            return None
+        self._mtime = mtime
+        content = read_proxy_file(self.path)
+        proxies = (content or {}).get("proxies")
+        # 补充器每轮都会刷新文件，只在列表真正变化时通知
+        if not proxies or proxies == self._proxies:
+            return None
+        self._proxies = proxies
+        return list(proxies)
+
+
+@dataclass
+class LiveProxy:
+    proxy: str
+    fetched_at: float
+    expires_at: float | None = None
+    rtt: float = float("inf")
+
+
+class ProxyReplenisher:
+    """
+    后台维持 target 个检测可用的代理
+
+    每 interval 秒一轮：丢弃即将过期(剩余不足 expiry_margin 秒)或超过 max_age 秒的代理，
+    重新检测剩下的并丢弃不可用的，不足 target 时调用 fetch 补充，最后把列表写入 output，
+    运行中的抢票进程通过 ProxyFileWatcher 读取并替换自己的代理池
+
+    fetch(n) 返回 [(代理地址, 过期时间戳或 None)]，例如 ProxyProvider.fetch_kuaidaili
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[int], list[tuple[str, float | None]]],
+        target: int = 5,
+        output: str = PROXY_FILE,
+        interval: float = 30,
+        max_age: float = 0,
+        expiry_margin: float = 15,
+        probe_timeout: float = 3.0,
+        test_url: str = "https://www.bilibili.com",
+        batch_size: int = 10,
+        max_fetches: int = 5,
+    ):
+        self.fetch = fetch
+        self.target = target
+        self.output = output
+        self.interval = interval
+        self.max_age = max_age
+        self.expiry_margin = expiry_margin
+        self.probe_timeout = probe_timeout
+        self.test_url = test_url
+        self.batch_size = batch_size
+        self.max_fetches = max_fetches
+        self.live: dict[str, LiveProxy] = {}
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def proxies(self) -> list[str]:
+        return [p.proxy for p in sorted(self.live.values(), key=lambda p: p.rtt)]
+
+    def _expired(self, proxy: LiveProxy, now: float) -> bool:
+        if proxy.expires_at is not None and proxy.expires_at - now < self.expiry_margin:
+            return True
+        return self.max_age > 0 and now - proxy.fetched_at > self.max_age
+
+    def _probe(self, proxies: list[str]) -> dict[str, float]:
+        # 补充器要的是当前是否可用，不使用检测缓存
+        return dict(probe_proxies(proxies, self.test_url, self.probe_timeout))
+
+    def run_once(self) -> list[str]:
+        """
+        执行一轮检查和补充，返回当前可用的代理，按响应时间排序
+        """
+        now = time.time()
+        expired = [p for p in self.live.values() if self._expired(p, now)]
+        for p in expired:
+            del self.live[p.proxy]
+        if expired:
+            logger.info(f"丢弃 {len(expired)} 个即将过期的代理")
+
+        for proxy, rtt in self._probe(list(self.live)).items():
+            if rtt == float("inf"):
+                logger.warning(f"代理 {proxy} 检测失败，丢弃")
+                del self.live[proxy]
+            else:
+                self.live[proxy].rtt = rtt
+
+        fetches = 0
+        while len(self.live) < self.target and fetches < self.max_fetches:
+            if fetches and self._stop_event.wait(1):  # 避免被限频
+                break
+            fetches += 1
+            try:
+                fetched = [
+                    (proxy, expires_at)
+                    for proxy, expires_at in self.fetch(self.batch_size)
+                    if proxy not in self.live
+                    and not (expires_at is not None and expires_at - now < self.expiry_margin)
+                ]
+            except Exception as e:
+                logger.error(f"拉取代理失败: {e}")
+                continue
+            rtts = self._probe([proxy for proxy, _ in fetched])
+            fetched_at = time.time()
+            for proxy, expires_at in fetched:
+                if len(self.live) >= self.target:
+                    break
+                if rtts.get(proxy, float("inf")) != float("inf"):
+                    self.live[proxy] = LiveProxy(
+                        proxy, fetched_at, expires_at, rtts[proxy]
+                    )
+
+        proxies = self.proxies
+        if len(proxies) < self.target:
+            logger.warning(f"可用代理 {len(proxies)}/{self.target}")
+        else:
+            logger.info(f"可用代理 {len(proxies)}/{self.target}")
+        # 没有可用代理时不改动列表，抢票进程继续使用手里的代理
+        if proxies:
+            write_proxy_file(self.output, proxies)
+        self.heartbeat()
+        return proxies
+
+    def heartbeat(self):
+        """
+        刷新存活标记，界面据此判断补充器是否还在运行
+        """
+        with open(heartbeat_path(self.output), "a"):
+            pass
+        os.utime(heartbeat_path(self.output))
+
+    def run(self):
+        # 上次运行留下的列表可能已经过期，先清空，只发布本次检测过的代理；
+        # 空列表会被 ProxyFileWatcher 忽略，运行中的抢票进程保留现有代理
+        write_proxy_file(self.output, [])
+        # 第一轮补充可能要拉取、检测好一会儿，先刷新一次避免被重复启动
+        self.heartbeat()
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.exception(e)
+            self._stop_event.wait(self.interval)
+
+    def start(self) -> "ProxyReplenisher":
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
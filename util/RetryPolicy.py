@@ -0,0 +1,177 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import loguru
+
+# B站通用错误码：-412 请求被拦截，-509 请求过于频繁
+THROTTLE_ERRNOS = frozenset({-412, -509})
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    一类接口的重试策略
+
+    max_attempts 包含第一次请求；第 n 次重试前等待 min(max_delay, base_delay * 2^(n-1))，
+    再乘以 [1 - jitter, 1] 之间的随机系数，避免多个任务同时重试
+    window 秒内这类接口最多重试 budget 次，持续被风控时不再放大请求量
+    """
+
+    name: str
+    max_attempts: int = 3
+    base_delay: float = 0.3
+    max_delay: float = 3.0
+    jitter: float = 0.5
+    budget: int = 20
+    window: float = 10.0
+    retry_statuses: frozenset[int] = frozenset({412, 429, 500, 502, 503, 504})
+    retry_errnos: frozenset[int] = field(default=THROTTLE_ERRNOS)
+
+    def backoff(self, retry: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return delay * (1 - self.jitter * random.random())
+
+
+DEFAULT_POLICIES = {
+    policy.name: policy
+    for policy in (
+        RetryPolicy("default"),
+        RetryPolicy(
+            "prepare", max_attempts=5, base_delay=0.1, max_delay=1.0, budget=30
+        ),
+        # BuyEngine 自己会按 CREATE_ATTEMPTS 反复下单，这里只兜底网络抖动和换代理
+        RetryPolicy(
+            "createV2", max_attempts=2, base_delay=0.02, max_delay=0.2, budget=120
+        ),
+        # 已经下单成功，拿不到付款二维码损失最大，多等一会儿
+        RetryPolicy(
+            "getPayParam",
+            max_attempts=8,
+            base_delay=0.5,
+            max_delay=5.0,
+            budget=20,
+            window=60.0,
+        ),
+        RetryPolicy("captcha", base_delay=0.2, max_delay=1.0),
+    )
+}
+
+# 按 URL 中的片段判断接口类别，先匹配先得
+ENDPOINT_PATTERNS = (
+    ("/order/prepare", "prepare"),
+    ("/order/createV2", "createV2"),
+    ("/order/getPayParam", "getPayParam"),
+    ("/gaia-vgate/", "captcha"),
+)
+
+
+def endpoint_of(url: str) -> str:
+    for pattern, name in ENDPOINT_PATTERNS:
+        if pattern in url:
+            return name
+    return "default"
+
+
+class RetryBudget:
+    """
+    滑动窗口内的重试次数，各接口类别分别计数，可以在多个线程间共用
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.history: dict[str, deque[float]] = {}
+
+    def acquire(self, policy: RetryPolicy) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            history = self.history.setdefault(policy.name, deque())
+            while history and now - history[0] > policy.window:
+                history.popleft()
+            if len(history) >= policy.budget:
+                return False
+            history.append(now)
+            return True
+
+
+class Retrier:
+    """
+    决定一次失败的请求是否重试、等待多久，每个决定都以结构化日志记录
+
+    日志的 extra 中带有 retry 字段，消息体是同样内容的 JSON，方便从日志文件里统计
+    """
+
+    def __init__(self, policies: dict[str, RetryPolicy] | None = None):
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self.budget = RetryBudget()
+
+    def policy_for(self, url: str, endpoint: str | None = None) -> RetryPolicy:
+        name = endpoint or endpoint_of(url)
+        return self.policies.get(name) or self.policies["default"]
+
+    def decide(
+        self,
+        policy: RetryPolicy,
+        attempt: int,
+        reason: str,
+        proxy: str | None = None,
+        wait: float | None = None,
+    ) -> float | None:
+        """
+        第 attempt 次请求失败后调用，返回下一次请求前要等待的秒数，放弃时返回 None
+
+        wait 不为空时用它代替指数退避，例如 412 时换一个代理立即重试
+        """
+        if attempt >= policy.max_attempts:
+            decision, delay = "give_up", None
+            detail = "attempts"
+        elif not self.budget.acquire(policy):
+            decision, delay = "give_up", None
+            detail = "budget"
+        else:
+            decision = "retry"
+            delay = policy.backoff(attempt) if wait is None else wait
+            detail = "backoff" if wait is None else "wait"
+        fields = {
+            "endpoint": policy.name,
+            "attempt": attempt,
+            "max_attempts": policy.max_attempts,
+            "reason": reason,
+            "proxy": proxy,
+            "decision": decision,
+            "detail": detail,
+            "delay": None if delay is None else round(delay, 3),
+        }
+        message = f"重试决策 {json.dumps(fields, ensure_ascii=False)}"
+        if delay is None:
+            loguru.logger.bind(retry=fields).warning(message)
+        else:
+            loguru.logger.bind(retry=fields).info(message)
+        return delay
+
+
+def response_reason(policy: RetryPolicy, response) -> str | None:
+    """
+    判断响应是否需要重试，返回原因(status:412、errno:-509、login)，不需要时返回 None
+
+    requests 和 httpx 的响应都可以传入
+    """
+    if response.status_code in policy.retry_statuses:
+        return f"status:{response.status_code}"
+    if response.status_code != 200:
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    if data.get("msg", "") == "请先登录":
+        return "login"
+    errno = data.get("errno", data.get("code"))
+    if errno in policy.retry_errnos:
+        return f"errno:{errno}"
+    return None
@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from util.TimeUtil import TimeUtil
+
+
+def parse_burst_offsets(offsets: str | None) -> list[float]:
+    """
+    解析首轮突发请求的时间偏移，如 "-20,0,20,40"，单位毫秒，返回秒
+    """
+    if not offsets:
+        return []
+    return sorted(float(x) / 1000 for x in offsets.split(",") if x.strip())
+
+
+class StartScheduler:
+    """
+    等待开票时间：先粗粒度 sleep 到开票前 guard 秒，只在最后的几毫秒自旋
+
+    每次 sleep 最多 max_sleep 秒，醒来后重新读取时间偏差，跟踪后台校时带来的变化
+    """
+
+    def __init__(
+        self, time_service: TimeUtil, guard: float = 0.03, max_sleep: float = 30
+    ) -> None:
+        self.time_service = time_service
+        self.guard = guard
+        self.max_sleep = max_sleep
+
+    def remaining(self, timestamp: float) -> float:
+        """
+        距离 timestamp（服务器时间）还有多少秒
+        """
+        return timestamp - time.time() + self.time_service.get_timeoffset()
+
+    async def async_wait_until(self, timestamp: float) -> None:
+        while (remaining := self.remaining(timestamp)) > self.guard:
+            await asyncio.sleep(min(remaining - self.guard, self.max_sleep))
+        end_time = time.perf_counter() + self.remaining(timestamp)
+        while time.perf_counter() < end_time:
+            # 让出事件循环，多个定时请求可以同时自旋
+            await asyncio.sleep(0)
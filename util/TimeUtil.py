@@ -1,37 +1,98 @@
+import statistics
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import ntplib
 from loguru import logger
 
+DEFAULT_NTP_SERVERS = (
+    "ntp.aliyun.com",
+    "ntp.tencent.com",
+    "ntp.ntsc.ac.cn",
+    "cn.pool.ntp.org",
+)
+
 
 class TimeUtil:
-    # NTP服务器默认为ntp.aliyun.com, 可根据实际情况修改
-    def __init__(self, _ntp_server="ntp.aliyun.com") -> None:
+    # NTP服务器默认为ntp.aliyun.com等国内服务器, 可根据实际情况修改
+    def __init__(
+        self,
+        _ntp_server="ntp.aliyun.com",
+        servers=None,
+        samples: int = 4,
+        strategy: str = "min_delay",
+        timeout: float = 2.0,
+    ) -> None:
+        """
+        :param servers: 同时查询的NTP服务器列表, 默认为 _ntp_server 加上内置的几台服务器
+        :param samples: 每台服务器的采样次数
+        :param strategy: min_delay 取往返延迟最小的样本, median 取各服务器结果的中位数
+        """
         self.ntp_server = _ntp_server
-        self.client = ntplib.NTPClient()
+        if servers:
+            self.servers = list(servers)
+        else:
+            self.servers = [_ntp_server] + [
+                s for s in DEFAULT_NTP_SERVERS if s != _ntp_server
+            ]
+        self.samples = max(1, samples)
+        self.strategy = strategy
+        self.timeout = timeout
         self.timeoffset: float = 0
+        self.uncertainty: float | None = None
+        self._sync_thread: threading.Thread | None = None
+        self._synced = threading.Event()
+
+    def _sample_server(self, server: str) -> list[tuple[float, float]]:
+        """
+        对单台服务器采样, 返回 [(offset, delay)], 单位秒
+        """
+        client = ntplib.NTPClient()
+        result = []
+        for _ in range(self.samples):
+            try:
+                response = client.request(server, version=4, timeout=self.timeout)
+                result.append((response.offset, response.delay))
+            except Exception as e:
+                logger.debug(f"NTP服务器 {server} 采样失败: {e}")
+            time.sleep(0.05)
+        return result
 
     def compute_timeoffset(self) -> str:
         """
         返回的timeoffset单位为秒
         """
-        # NTP时间请求有可能会超时失败, 设定三次重试机会
-        response = None
-        for i in range(0, 3):
-            try:
-                response = self.client.request(self.ntp_server, version=4)
-                break
-            except Exception:
-                logger.warning("第" + str(i + 1) + "次获取NTP时间失败, 尝试重新获取")
-                if i == 2:
-                    return "error"
-                time.sleep(0.5)
-        if response is None:
+        with ThreadPoolExecutor(max_workers=len(self.servers)) as executor:
+            results = dict(
+                zip(self.servers, executor.map(self._sample_server, self.servers))
+            )
+        # 每台服务器取延迟最小的样本, 延迟越小越接近真实偏差
+        best = {
+            server: min(samples, key=lambda x: x[1])
+            for server, samples in results.items()
+            if samples
+        }
+        if not best:
             logger.error("无法获取NTP时间")
             return "error"
-        logger.info("时间同步成功, 将使用" + self.ntp_server + "时间")
-        # response.offset 为[NTP时钟源 - 设备时钟]的偏差, 使用时需要取反
-        return format(-(response.offset), ".5f")
+
+        if self.strategy == "median":
+            offsets = [offset for offset, _ in best.values()]
+            offset = statistics.median(offsets)
+            spread = statistics.median(abs(x - offset) for x in offsets)
+            half_delay = statistics.median(delay / 2 for _, delay in best.values())
+            self.uncertainty = max(spread, half_delay)
+            source = ",".join(best)
+        else:
+            source, (offset, delay) = min(best.items(), key=lambda x: x[1][1])
+            self.uncertainty = delay / 2
+        logger.info(
+            f"时间同步成功, 将使用{source}时间, 误差约 ±{self.uncertainty * 1000:.1f}ms "
+            f"({len(best)}/{len(self.servers)} 台服务器可用)"
+        )
+        # offset 为[NTP时钟源 - 设备时钟]的偏差, 使用时需要取反
+        return format(-offset, ".5f")
 
     def set_timeoffset(self, _timeoffset: str) -> None:
         """
@@ -42,6 +103,7 @@ class TimeUtil:
             logger.warning("NTP时间同步失败, 使用本地时间")
         else:
             self.timeoffset = float(_timeoffset)
+        self._synced.set()
         logger.info("设置时间偏差为: " + str(self.timeoffset) + "秒")
 
     def get_timeoffset(self) -> float:
@@ -49,3 +111,41 @@ class TimeUtil:
         获取到的timeoffset单位为秒
         """
         return self.timeoffset
+
+    def get_uncertainty(self) -> float | None:
+        """
+        最近一次同步的误差估计, 单位为秒, 未同步成功时为None
+        """
+        return self.uncertainty
+
+    def start_initial_sync(self) -> None:
+        """
+        在后台线程中完成第一次同步, 不阻塞调用方
+        """
+        threading.Thread(
+            target=lambda: self.set_timeoffset(self.compute_timeoffset()), daemon=True
+        ).start()
+
+    def wait_synced(self, timeout: float | None = None) -> bool:
+        """
+        等待第一次同步完成(失败也算完成), 超时返回False
+        """
+        return self._synced.wait(timeout)
+
+    def start_background_sync(self, interval: float = 300) -> None:
+        """
+        在后台线程中每隔 interval 秒重新同步, 跟踪长时间等待中的时钟漂移
+        """
+        if self._sync_thread is not None and self._sync_thread.is_alive():
+            return
+
+        def sync_loop():
+            while True:
+                time.sleep(interval)
+                timeoffset = self.compute_timeoffset()
+                # 同步失败时保留上一次的结果
+                if timeoffset != "error":
+                    self.set_timeoffset(timeoffset)
+
+        self._sync_thread = threading.Thread(target=sync_loop, daemon=True)
+        self._sync_thread.start()
@@ -2,15 +2,13 @@ from collections import namedtuple
 from dataclasses import dataclass, field
 import os
 import sys
+import threading
 import time
 import loguru
 import importlib
 from typing import Any, Optional
 from loguru import logger
-from util.BiliRequest import BiliRequest
-from util.KVDatabase import KVDatabase
 from util.LogConfig import loguru_config
-from util.TimeUtil import TimeUtil
 
 
 def get_application_path() -> str:
@@ -71,9 +69,7 @@ __all__ = [
 loguru.logger.debug(
     f"设置路径, FILES_ROOT_PATH={FILES_ROOT_PATH} TEMP_PATH={TEMP_PATH} EXE_PATH={EXE_PATH}"
 )
-ConfigDB = KVDatabase(os.path.join(EXE_PATH, "config.json"))
 GLOBAL_COOKIE_PATH = os.path.join(EXE_PATH, "cookies.json")
-main_request = BiliRequest(cookies_config_path=GLOBAL_COOKIE_PATH)
 
 
 def set_main_request(request):
@@ -81,17 +77,58 @@ def set_main_request(request):
     main_request = request
 
 
-time_service = TimeUtil()
-time_service.set_timeoffset(time_service.compute_timeoffset())
+def _create_config_db():
+    from util.KVDatabase import KVDatabase
 
+    return KVDatabase(os.path.join(EXE_PATH, "config.json"))
+
+
+def _create_main_request():
+    from util.BiliRequest import BiliRequest
+
+    return BiliRequest(cookies_config_path=GLOBAL_COOKIE_PATH)
+
+
+def _create_time_service():
+    from util.TimeUtil import TimeUtil
+
+    service = TimeUtil(
+        servers=[s for s in os.environ.get("BTB_NTP_SERVERS", "").split(",") if s],
+        samples=int(os.environ.get("BTB_NTP_SAMPLES", 4)),
+    )
+    # 第一次校时放到后台，不阻塞启动
+    service.start_initial_sync()
+    return service
+
+
+def _load_bili_ticket_gt_python() -> Optional[Any]:
+    try:
+        return importlib.import_module("bili_ticket_gt_python")
+    except Exception as e:
+        logger.error(f"本地验证码模块加载失败，错误信息：{e}")
+        logger.error("请更换设备")
+        return None
+
+
+# 这些全局对象在第一次被访问时才创建，import util 本身不做网络请求和文件读写
+_LAZY_GLOBALS = {
+    "ConfigDB": _create_config_db,
+    "main_request": _create_main_request,
+    "time_service": _create_time_service,
+    "bili_ticket_gt_python": _load_bili_ticket_gt_python,
+}
+_lazy_lock = threading.RLock()
+
+
+def __getattr__(name: str):
+    factory = _LAZY_GLOBALS.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lazy_lock:
+        if name not in globals():
+            globals()[name] = factory()
+    return globals()[name]
 
-global bili_ticket_gt_python
-bili_ticket_gt_python: Optional[Any] = None
-try:
-    bili_ticket_gt_python = importlib.import_module("bili_ticket_gt_python")
-except Exception as e:
-    logger.error(f"本地验证码模块加载失败，错误信息：{e}")
-    logger.error("请更换设备")
 
 Endpoint = namedtuple("Endpoint", ["endpoint", "detail", "update_at"])
 
@@ -99,7 +136,10 @@ Endpoint = namedtuple("Endpoint", ["endpoint", "detail", "update_at"])
 @dataclass
 class GlobalStatus:
     nowTask: str = "none"
+    # 可以分配任务的 worker
     endpoint_details: dict[str, Endpoint] = field(default_factory=dict)
+    # 无界面抢票进程，只用来展示，不分配任务
+    buy_details: dict[str, Endpoint] = field(default_factory=dict)
 
     def available_endpoints(self) -> list[Endpoint]:
         return [
@@ -108,5 +148,10 @@ class GlobalStatus:
             if time.time() - t.update_at < 4
         ]
 
+    def running_buys(self) -> list[Endpoint]:
+        return [
+            t for endpoint, t in self.buy_details.items() if time.time() - t.update_at < 4
+        ]
+
 
 GlobalStatusInstance = GlobalStatus()